@@ -0,0 +1,61 @@
+"""Module aggregating the data of charts on the server.
+
+Charts show each incident as long as there are few of them. Above MAX_RAW_POINTS, histograms are
+binned on the server and curves are downsampled, so that the size of the figures sent to the
+browser stays bounded whatever the number of incidents.
+"""
+
+import numpy as np
+
+# Number of incidents above which charts are aggregated.
+MAX_RAW_POINTS = 5000
+
+# Maximum number of points of a downsampled curve.
+MAX_CURVE_POINTS = 2000
+
+# Maximum number of bins of a histogram.
+_MAX_BINS = 100
+
+
+def histogram(values_list, max_bins=_MAX_BINS):
+    """
+    Bin several sets of values, with the same bins for all of them.
+
+    :param values_list: (list) arrays of values, NaN values are ignored.
+    :param max_bins: (int) maximum number of bins.
+
+    :return: (np.array, list) the centers of the bins, and the counts of each set of values in
+        each bin.
+    """
+    values_list = [np.asarray(values, dtype=float) for values in values_list]
+    values_list = [values[~np.isnan(values)] for values in values_list]
+    edges = np.histogram_bin_edges(np.concatenate(values_list), bins='auto')
+    if len(edges) > max_bins + 1:
+        edges = np.linspace(edges[0], edges[-1], max_bins + 1)
+    centers = (edges[:-1] + edges[1:]) / 2
+    return centers, [np.histogram(values, bins=edges)[0] for values in values_list]
+
+
+def downsample_by_category(categories, max_points=MAX_CURVE_POINTS):
+    """
+    Pick points of a sorted curve, evenly spread along the curve for each category of points.
+
+    Each category keeps its first and last points and a number of points proportional to its
+    size, so that the shape of the curve and the share of each category are kept.
+
+    :param categories: (np.array) the category of each point of the curve, in order.
+    :param max_points: (int) the number of points to keep, approximately.
+
+    :return: (np.array) the sorted positions of the points to keep.
+    """
+    categories = np.asarray(categories)
+    num_points = len(categories)
+    if num_points <= max_points:
+        return np.arange(num_points)
+    picked = []
+    for category in np.unique(categories):
+        positions = np.flatnonzero(categories == category)
+        num_picked = min(len(positions), max(2, round(max_points * len(positions) / num_points)))
+        picked.append(positions[np.unique(
+            np.linspace(0, len(positions) - 1, num_picked).round().astype(int))])
+    return np.sort(np.concatenate(picked))
@@ -0,0 +1,165 @@
+"""Run simulations in batch, without the web app.
+
+Scenarios are described in a JSON config file:
+
+    {
+        "incidents": "data/dataACRtime_GPSCSPCpostime_v7.csv",
+        "starting_points": {"Bases": "data/my_bases.csv"},
+        "scenarios": [
+            {"name": "baseline"},
+            {"name": "fast", "drone_input": "Bases", "input_speed": 120, "input_jour": true}
+        ]
+    }
+
+Each scenario has a unique name, the name of its drones starting points (drone_input) and any field
+of simulation.SimulationParams, the others take the web app default values. Incidents and starting
+points are optional, by default those of the web app are used. Relative paths are relative to the
+config file.
+
+Usage:
+
+    python batch.py scenarios.json --output results/ --workers 4
+
+It writes summary.csv with one row per scenario (its parameters and the metrics of
+simulation.summarize_outcomes) and, for each scenario, <name>.csv with the outcome of each
+incident.
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import datasets
+import drones
+import process_pool
+import simulation
+
+_DEFAULT_DRONE_INPUT = 'Postes de commandement'
+
+
+def _run_scenario(context, scenario):
+    name, drone_input, params = scenario
+    incidents = context['incidents']
+    locators = context.setdefault('locators', {})
+    if drone_input not in locators:
+        locators[drone_input] = simulation.build_locator(
+            incidents, context['starting_points'][drone_input])
+    result = simulation.run(
+        incidents, context['starting_points'][drone_input], params,
+        locator=locators[drone_input], dispatch_workers=context['dispatch_workers'])
+    result.to_frame().to_csv(os.path.join(context['output_dir'], f'{name}.csv'))
+    return dict(
+        name=name, drone_input=drone_input, **dataclasses.asdict(params), **result.summary())
+
+
+def _parse_scenario(config, starting_points):
+    config = dict(config)
+    name = config.pop('name', None)
+    if not name or os.path.basename(name) != name:
+        raise ValueError(f'Invalid scenario name "{name}"')
+    drone_input = config.pop('drone_input', _DEFAULT_DRONE_INPUT)
+    if drone_input not in starting_points:
+        raise ValueError(f'Unknown starting points "{drone_input}" in scenario "{name}"')
+    param_names = {field.name for field in dataclasses.fields(simulation.SimulationParams)}
+    unknown_params = set(config) - param_names
+    if unknown_params:
+        raise ValueError(
+            f'Unknown parameters in scenario "{name}": {", ".join(sorted(unknown_params))}')
+    return name, drone_input, simulation.SimulationParams(**config)
+
+
+def load_config(config_path):
+    """
+    Load a batch config file, see the module documentation for its format.
+
+    :param config_path: (str) path of the JSON config file.
+
+    :return: (simulation.IncidentTable, dict, list) the incidents, the starting points by name
+        and the scenarios as tuples (name, drone_input, simulation.SimulationParams).
+    """
+    with open(config_path, encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    config_dir = os.path.dirname(config_path)
+
+    if config.get('incidents'):
+        incidents = datasets.parse_incidents(os.path.join(config_dir, config['incidents']))
+    else:
+        incidents = datasets.load_default_incidents()
+
+    starting_points = dict(drones.STARTING_POINTS)
+    for name, path in config.get('starting_points', {}).items():
+        starting_points[name] = np.genfromtxt(
+            os.path.join(config_dir, path), delimiter=',', dtype=str)
+
+    scenarios = [
+        _parse_scenario(scenario, starting_points) for scenario in config.get('scenarios', [])]
+    names = [name for name, unused_drone_input, unused_params in scenarios]
+    if len(set(names)) < len(names):
+        raise ValueError('Scenario names must be unique')
+    return incidents, starting_points, scenarios
+
+
+def run_batch(
+        incidents, starting_points, scenarios, output_dir, max_workers=None, dispatch_workers=1):
+    """
+    Run many scenarios and write their results to disk.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param starting_points: (dict) drones initial locations (name, latitude, longitude) by name.
+    :param scenarios: (list) tuples (name, drone_input, simulation.SimulationParams), see
+        load_config.
+    :param output_dir: (str) directory where to write the results.
+    :param max_workers: (int) number of worker processes, by default the number of CPUs. With 1,
+        scenarios are run in the current process.
+    :param dispatch_workers: (int) number of worker processes of the dispatch of each scenario,
+        see simulation.dispatch_drones: use it with max_workers=1 to run a few scenarios on a
+        dataset spanning years.
+
+    :return: (pd.DataFrame) one row per scenario with its parameters and main metrics.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    context = {
+        'incidents': incidents,
+        'starting_points': starting_points,
+        'output_dir': output_dir,
+        'dispatch_workers': dispatch_workers,
+    }
+    rows = process_pool.map_with_context(
+        _run_scenario, scenarios, context, max_workers=max_workers)
+
+    summary = pd.DataFrame(rows).set_index('name')
+    summary.to_csv(os.path.join(output_dir, 'summary.csv'))
+    return summary
+
+
+def main(string_args=None):
+    """Parse command line arguments and run a batch of scenarios."""
+    parser = argparse.ArgumentParser(
+        description='Run drone simulations in batch, see batch.py for the config format.')
+    parser.add_argument('config', help='path of the JSON config file describing the scenarios')
+    parser.add_argument(
+        '--output', default='results', help='directory where to write the results')
+    parser.add_argument(
+        '--incidents', help='CSV file of incidents, overriding the one of the config file')
+    parser.add_argument(
+        '--workers', type=int, help='number of worker processes, by default the number of CPUs')
+    parser.add_argument(
+        '--dispatch-workers', type=int, default=1,
+        help='number of worker processes of the dispatch of each scenario, e.g. with --workers 1')
+    args = parser.parse_args(string_args)
+
+    incidents, starting_points, scenarios = load_config(args.config)
+    if args.incidents:
+        incidents = datasets.parse_incidents(args.incidents)
+    summary = run_batch(
+        incidents, starting_points, scenarios, args.output, max_workers=args.workers,
+        dispatch_workers=args.dispatch_workers)
+    print(summary.to_string())
+
+
+if __name__ == '__main__':
+    main()
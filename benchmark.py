@@ -0,0 +1,177 @@
+"""Benchmark each stage of the simulation on synthetic datasets of growing size.
+
+Usage:
+
+    python benchmark.py --sizes 3000 30000 --fleets 'Centres de secours' 1000 --output bench.json
+
+Fleets are names of drones.STARTING_POINTS or numbers of random bases around Paris. Results are
+written in a JSON file: the environment of the run and, for each stage, dataset size and fleet,
+the best time in seconds among the repeats.
+"""
+
+import argparse
+import functools
+import gettext
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import datasets
+import diagrams
+import drones
+import simulation
+import synthetic
+
+_DEFAULT_SIZES = (3000, 30000, 300000, 3000000)
+_DEFAULT_FLEETS = ('Postes de commandement', 'Centres de secours', '1000', '5000')
+
+
+def _best_time(repeat, function, *args):
+    """Call a function several times, and return its last result and its best time in seconds."""
+    best = float('inf')
+    value = None
+    for unused_index in range(repeat):
+        start = time.perf_counter()
+        value = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return value, best
+
+
+def _starting_points(fleet, seed):
+    if fleet in drones.STARTING_POINTS:
+        return drones.STARTING_POINTS[fleet]
+    return synthetic.generate_starting_points(int(fleet), seed=seed)
+
+
+def _draw_selection(incidents, params):
+    return simulation.draw_selection(
+        incidents, simulation.new_random_state(params.seed, params.common_random_numbers),
+        params.detec_rate_home, params.no_witness_rate, params.detec_rate_vp)
+
+
+def _sankey(result):
+    """Build the Sankey diagram of the web app from the outcome of a simulation."""
+    return diagrams.create_sankey(result, with_night=True)
+
+
+def run_benchmarks(sizes, fleets, repeat=1, seed=0, params=None, dispatch_workers=1):
+    """
+    Time each stage of a simulation.
+
+    :param sizes: (list) numbers of incidents of the synthetic datasets.
+    :param fleets: (list) names of drones.STARTING_POINTS or numbers of random bases, as strings.
+    :param repeat: (int) number of runs of each stage, only the best time is kept.
+    :param seed: (int) seed of the synthetic datasets.
+    :param params: (simulation.SimulationParams) parameters of the simulation, by default those
+        of the web app.
+    :param dispatch_workers: (int) number of worker processes of the sharded dispatch, also
+        timed if not 1, see simulation.dispatch_drones.
+
+    :return: (list) one dict per stage, dataset size and fleet with their time in seconds.
+    """
+    if params is None:
+        params = simulation.SimulationParams()
+    # The Sankey diagram translates its labels, keep them in English.
+    gettext.install('messages')
+    records = []
+
+    def _record(stage, num_incidents, fleet, num_drones, seconds):
+        records.append(dict(
+            stage=stage, num_incidents=num_incidents, fleet=fleet, num_drones=num_drones,
+            seconds=seconds))
+        print(f'{stage:>10} {num_incidents:>9} incidents {num_drones:>6} drones: '
+              f'{seconds:.3f}s', file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for num_incidents in sizes:
+            csv_path = os.path.join(work_dir, f'incidents_{num_incidents}.csv')
+            synthetic.write_incidents_csv(
+                synthetic.generate_incidents(num_incidents, seed=seed), csv_path)
+            incidents, seconds = _best_time(repeat, datasets.parse_incidents, csv_path)
+            os.remove(csv_path)
+            _record('parse', len(incidents), None, 0, seconds)
+
+            (night, no_flight), seconds = _best_time(
+                repeat, simulation.flight_restrictions, incidents, params.input_jour)
+            _record('restrict', len(incidents), None, 0, seconds)
+            (no_detection, no_witness), seconds = _best_time(
+                repeat, _draw_selection, incidents, params)
+            _record('selection', len(incidents), None, 0, seconds)
+            no_drone = no_flight | no_detection | no_witness
+
+            for fleet in fleets:
+                avail_ini = _starting_points(fleet, seed)
+                locator, seconds = _best_time(
+                    repeat, simulation.build_locator, incidents, avail_ini)
+                _record('locator', len(incidents), fleet, len(avail_ini), seconds)
+                (dists, declined), seconds = _best_time(
+                    repeat, simulation.dispatch_drones, incidents, locator, no_drone,
+                    params.unavail_delta)
+                _record('dispatch', len(incidents), fleet, len(avail_ini), seconds)
+                if dispatch_workers != 1:
+                    unused_dispatch, seconds = _best_time(
+                        repeat, functools.partial(
+                            simulation.dispatch_drones, max_workers=dispatch_workers),
+                        incidents, locator, no_drone, params.unavail_delta)
+                    _record('sharded', len(incidents), fleet, len(avail_ini), seconds)
+                drone_delay, seconds = _best_time(
+                    repeat, simulation.compute_drone_delay, dists, no_drone | declined,
+                    params.input_speed, params.input_acc, params.vert_acc, params.alt,
+                    params.dep_delay, params.arr_delay, params.detec_delay)
+                _record('kinematics', len(incidents), fleet, len(avail_ini), seconds)
+                result = simulation.SimulationResult(
+                    night=night, no_flight=no_flight, no_detection=no_detection,
+                    no_witness=no_witness, dists=dists, declined=declined, drone_delay=drone_delay,
+                    time_diff=simulation.compute_time_diff(incidents, drone_delay))
+                unused_sankey, seconds = _best_time(repeat, _sankey, result)
+                _record('sankey', len(incidents), fleet, len(avail_ini), seconds)
+                del locator
+    return records
+
+
+def main(string_args=None):
+    """Parse command line arguments and run the benchmarks."""
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the simulation.')
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=_DEFAULT_SIZES,
+        help='numbers of incidents of the synthetic datasets')
+    parser.add_argument(
+        '--fleets', nargs='+', default=_DEFAULT_FLEETS,
+        help='names of predefined starting points, or numbers of random bases')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='number of runs of each stage, the best is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic datasets')
+    parser.add_argument(
+        '--dispatch-workers', type=int, default=1,
+        help='number of worker processes of the sharded dispatch, also timed if not 1')
+    parser.add_argument(
+        '--output', default='benchmark.json', help='JSON file where to write the results')
+    args = parser.parse_args(string_args)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'dispatch_workers': args.dispatch_workers,
+        },
+        'results': run_benchmarks(
+            args.sizes, args.fleets, repeat=args.repeat, seed=args.seed,
+            dispatch_workers=args.dispatch_workers),
+    }
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
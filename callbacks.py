@@ -1,143 +1,70 @@
 import base64
-import copy
-import datetime as dt
+import concurrent.futures
 import functools
 import gettext
 import hashlib
 import io
-import math
+import json
+import logging
+import os
+import tempfile
 
-from dash import exceptions
+from dash import exceptions, no_update
 from dash.dependencies import Input, Output, State
+import dash_bootstrap_components as dbc
 import dash_html_components as html
-import geopy.distance
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.utils
 
 from app import app
+import aggregation
+import datasets
+import diagrams
 import drones
-
-# datetime of the beginning of the emergency call
-col_time_em_call = 'time_call'
-# in seconds, BLS team delay
-col_BLS_time = 'BLS_time'
-# indicator: 1 if the incident is during the day, 0 during the night
-col_indic_day = 'day'
-# indicator : 1 if the incident is at home, 0 otherwise
-col_indic_home = 'home'
-# Latitude WGS84
-col_lat_inter = 'latitude'
-# Longitude WGS84
-col_lon_inter = 'longitude'
-
-# indicator: 1 if wind is low enough to fly (less than 50 km/h)
-col_indic_wind = 'low_wind'
-# indicator: 1 if sight is clear enough to fly
-col_indic_sight = 'clear_sight'
-
-col_drone_delay = 'col_res'
-
-
-@functools.lru_cache(3)
-def _load_incidents(contents):
-    if contents:
-        content_ = contents.split(',')
-        content_string = content_[1]
-        decoded = base64.b64decode(content_string)
-        incidents_csv = io.StringIO(decoded.decode('utf-8'))
-    else:
-        incidents_csv = 'data/dataACRtime_GPSCSPCpostime_v7.csv'
-    incidents = pd.read_csv(incidents_csv, encoding='latin-1', index_col=0)
-    print(incidents)
-    incidents[col_time_em_call] = pd.to_datetime(incidents[col_time_em_call])
-    incidents = incidents.loc[incidents[col_BLS_time] >= 0]
-    incidents = incidents.loc[incidents[col_BLS_time] <= 25 * 60]
-    return incidents
+import flows
+import instrumentation
+import jobs
+import result_cache
+import simulation
 
 
 _CUSTOM_DRONE_INPUT = 'custom'
 
+_LOGGER = logging.getLogger(__name__)
 
-def update_avail(time_dec, avail, unavail):
-    """
-    Update of the available fleet of drones after each launch.
+# Simulation results shared by all users, with a memory budget in MB and an optional directory to
+# keep them on disk.
+_RESULT_CACHE = result_cache.ResultCache(
+    max_bytes=int(os.getenv('RESULT_CACHE_MB', '256')) * 2 ** 20,
+    disk_dir=os.getenv('RESULT_CACHE_DIR'))
 
-    :param time_dec: (dt.datetime) Datetime when the incident started.
-    :param avail: (np.array) List of available drones (name, GPS location)
-    :param unavail: (np.array) List of unavailable drones (name, GPS location and datetime until
-        when they are unavailable)
+# Outputs of the stages of simulations, to only compute again the stages whose inputs changed,
+# with a memory budget in MB and an optional directory to keep them on disk.
+_STAGE_CACHE = result_cache.ResultCache(
+    max_bytes=int(os.getenv('STAGE_CACHE_MB', '256')) * 2 ** 20,
+    disk_dir=os.getenv('STAGE_CACHE_DIR'))
 
-    :return: (np.array, np.array) Updated list of available and unavailable drones.
-    """
-    drop_drone = []
-    for i in range(0, unavail.shape[0]):
-        if unavail[i][3] < time_dec:
-            avail = np.append(avail, [[unavail[i][0], unavail[i][1], unavail[i][2]]], axis=0)
-            drop_drone.append(i)
+# Uploaded incidents datasets, with a memory budget in MB and a directory to keep them parsed on
+# disk.
+_DATASETS = datasets.DatasetStore(
+    max_bytes=int(os.getenv('DATASET_CACHE_MB', '512')) * 2 ** 20,
+    disk_dir=os.getenv(
+        'DATASET_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'drone-simulation-datasets')))
 
-    res_unavail = np.delete(unavail, drop_drone, axis=0)
-    return avail, res_unavail
 
+# Simulations running in the background, with the number of simulations running at once.
+_JOBS = jobs.JobManager(max_workers=int(os.getenv('SIMULATION_WORKERS', '2')))
 
-def drone_unavail(df, duree, avail_ini):
-    """
-    For all incident selects the closest available drone to send.
-    :param df:
-    :param duree:
-    :param avail_ini:
-    :return:
-    """
+# Stages of a simulation reported as its progress, see _compute_drone_time.
+_SIMULATION_STAGES = (
+    'dataset', 'lookup', 'locator', 'selection', 'dispatch', 'kinematics', 'sankey', 'figures',
+    'serialize', 'cache')
 
-    avail = copy.deepcopy(avail_ini)
-    # init
-    unavail = np.array([['NULL', 0.0, 0.0, dt.datetime(2017, 1, 1, 0, 0, 0)]])
-    list_dist = []
-
-    for unused_index, row in df.iterrows():
-        time_dec = row[col_time_em_call]
-        avail, unavail = update_avail(time_dec, avail, unavail)
-        lat_a = row[col_lat_inter]
-        lon_a = row[col_lon_inter]
-        coord_a = (lat_a, lon_a)
-
-        dist_tot = []
-        for drone in avail:
-            coord_drone = (drone[1], drone[2])
-            try:
-                dist = geopy.distance.geodesic(coord_drone, coord_a).km
-            except ValueError:
-                dist = np.nan
-            dist_tot.append(dist)
-
-        try:
-            min_dist = np.nanmin(dist_tot)
-            min_ind = dist_tot.index(min_dist)
-            cs_rm = avail[min_ind]
-            avail = np.delete(avail, min_ind, axis=0)
-            time_unavail = time_dec + dt.timedelta(hours=duree)
-            new_unavail = np.array([cs_rm[0], cs_rm[1], cs_rm[2], time_unavail])
-            unavail = np.vstack([unavail, new_unavail])
-            list_dist.append(min_dist)
-        except ValueError:
-            list_dist.append(np.nan)
-
-    return list_dist
-
-
-def select_interv(all_incidents, condition, column, rate):
-    """Select randomly some incidents.
-
-    :param all_incidents: a DataFrame containing incidents. This will be modified.
-    :param condition: a boolean array, the same size of df to restrict the rows that can be
-        affected: True for those that can be selected, False if not.
-    :param column: (str) The name of the column of df to null if not selected.
-    :param rate (float) The rate (between 0 and 1) of rows that should be kept.
-    """
-    selected = np.random.rand(len(all_incidents)) > rate
-    selected_final = condition & selected
-    all_incidents.loc[selected_final, column] = 0
-    return all_incidents, selected_final
+# Delay in seconds to wait for a simulation before reporting its progress: cached results and
+# short simulations are returned at once.
+_JOB_WAIT = .3
 
 
 def _read_uploaded_data(contents):
@@ -149,13 +76,15 @@ def _read_uploaded_data(contents):
 
 
 def _compute_drone_time(
-        drone_input, custom_drone_input, custom_incidents_dataset,
+        drone_input, custom_drone_input, incidents_digest,
         input_speed, input_acc, vert_acc, alt, dep_delay, arr_delay, detec_delay,
-        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta, lang):
+        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta,
+        dispatch_policy, lang, report=None):
     """
     Computes drone simulated flights.
 
-    :param custom_incidents_dataset: (str) incidents data as CSV
+    :param incidents_digest: (str) digest of the uploaded incidents dataset in _DATASETS, None
+        for the default one
     :param drone_input: (str) drones initial locations as index for STARTING_POINTS
     :param custom_drone_input: (str) drones initial locations as CSV data
     :param input_speed: (str) drone horizontal speed in km/h
@@ -173,9 +102,13 @@ def _compute_drone_time(
         place detection by 18/112 operators ([0,1])
     :param unavail_delta: (str) delay during which a drone is unavailable after being sent to an
         OHCA in hours
+    :param dispatch_policy: (str) policy choosing which available drone is sent, a key of
+        policies.POLICIES
     :param lang: (str) the language code used by the interface.
+    :param report: (instrumentation.RunReport) where to record the time and memory used by each
+        stage, None to skip it.
 
-    :return: graphs for Dash visualisation
+    :return: the figures of the graphs 1 to 4 of a simulation, see layouts.create_graphs_layout.
     """
     # drone_input = 'Postes de commandement'
     # input_wind = 'Non'
@@ -193,14 +126,15 @@ def _compute_drone_time(
     # unavail_delta = '6'
     # lang = 'fr'
 
-    np.random.seed(123)
-
     if lang:
         t11n = gettext.translation('messages', localedir='locales', languages=[lang], fallback=True)
         t11n.install()
 
-    dep_delay = np.float(dep_delay) + np.float(detec_delay) + (np.float(alt) / np.float(vert_acc))
-    arr_delay = np.float(arr_delay) + (np.float(alt) / np.float(vert_acc))
+    dep_delay = np.float(dep_delay)
+    arr_delay = np.float(arr_delay)
+    detec_delay = np.float(detec_delay)
+    alt = np.float(alt)
+    vert_acc = np.float(vert_acc)
     input_acc = np.float(input_acc)
     detec_rate_home = np.float(detec_rate_home)
     no_witness_rate = np.float(no_witness_rate)
@@ -216,66 +150,31 @@ def _compute_drone_time(
     else:
         avail_ini_ = drones.STARTING_POINTS[drone_input]
 
-    res_col_a = 'col_res'
+    res_col_a = simulation.col_drone_delay
     res_col_b = 'apport_drone'
-    df_res = copy.deepcopy(_load_incidents(custom_incidents_dataset))
+    incidents = _DATASETS.get(incidents_digest)
+    instrumentation.lap(report, 'dataset')
 
     # Apport drone: si négatif, temps gagné grâce au drone. Sinon, temps gagné grâce au VSAV.
 
-    no_drone = dict()
-    no_drone['night'] = np.full((len(df_res),), False)
-
-    df_res[col_drone_delay] = np.nan
-    if not input_jour:
-        index_nuit = df_res[col_indic_day] == 0
-        no_drone['night'] = index_nuit
-        df_res.loc[index_nuit, col_drone_delay] = 0
-
-    df_res.loc[df_res[col_indic_wind] == 0, col_drone_delay] = 0
-    df_res.loc[df_res[col_indic_sight] == 0, col_drone_delay] = 0
-
-    in_a_public_place = df_res[col_indic_home] == 0
-    # detection rate of OHCA in a public place
-    df_res, index_detec_rate_vp = \
-        select_interv(df_res, in_a_public_place, col_drone_delay, detec_rate_vp)
-    # detection rate of OHCA in a private place (at home)
-    df_res, index_detec_home = select_interv(df_res, ~in_a_public_place, col_drone_delay,
-                                             detec_rate_home)
-    # update no drone reasons : lack of detection
-    no_drone['no detection'] = np.logical_or(index_detec_rate_vp, index_detec_home)
-
-    # rate of OHCA witnesses home alone
-    df_res, index_witness = select_interv(df_res, ~in_a_public_place, col_drone_delay,
-                                          1 - no_witness_rate)
-    # update no drone reasons : not enough witnesses
-    no_drone['not enough witnesses'] = index_witness
-
-    df_ic = df_res.loc[df_res[col_drone_delay] != 0]
-    distance_field = 'Distance'
-    df_ic[distance_field] = drone_unavail(df_ic, unavail_delta, avail_ini_)  # TODO
-
-    for i, r in df_ic.iterrows():
-        eff_speed = input_speed
-        # distance covered during acceleration and brake
-        acc_dist = 2 * eff_speed * input_acc / 3600
-        acc = eff_speed / (input_acc * 3600)
-
-        dist = r[distance_field]
-
-        lin_dist = dist - acc_dist
-        if lin_dist >= 0:
-            lin_time = (dist / eff_speed) * 3600
-            res_time = lin_time + dep_delay + arr_delay + 2 * input_acc
-        else:
-            res_time = dep_delay + arr_delay + 2 * math.sqrt(dist / acc)
-
-        df_res.loc[i, col_drone_delay] = np.round(res_time)
-
-    df_res[res_col_b] = df_res[res_col_a] - df_res[col_BLS_time]
-
-    df_res.loc[df_res[res_col_a] == 0, res_col_b] = \
-        df_res.loc[df_res[res_col_a] == 0, col_BLS_time]
-    dfi = df_res.dropna(axis=0, how='all', thresh=None, subset=[res_col_b], inplace=False)
+    result = simulation.run(incidents, avail_ini_, simulation.SimulationParams(
+        input_speed=input_speed, input_acc=input_acc, vert_acc=vert_acc, alt=alt,
+        dep_delay=dep_delay, arr_delay=arr_delay, detec_delay=detec_delay, input_jour=input_jour,
+        detec_rate_home=detec_rate_home, no_witness_rate=no_witness_rate,
+        detec_rate_vp=detec_rate_vp, unavail_delta=unavail_delta,
+        dispatch_policy=dispatch_policy), report=report,
+        cache=_STAGE_CACHE, data_keys={
+            'incidents': incidents_digest or 'default',
+            'drones': hashlib.sha256(json.dumps(np.asarray(avail_ini_).tolist()).encode('utf-8'))
+            .hexdigest()})
+
+    # Only the results needed for the figures.
+    df_res = pd.DataFrame({
+        simulation.col_BLS_time: incidents.bls_time,
+        res_col_a: result.drone_delay,
+        res_col_b: result.time_diff,
+    })
+    dfi = df_res[df_res[res_col_b].notna()].copy()
 
     # simple metrics
     # n_nodrone = len(dfi.loc[dfi[res_col_a] == 0])
@@ -283,7 +182,6 @@ def _compute_drone_time(
     # n_drone = len(dfi.loc[dfi[res_col_b] < 0])
     # n_bls = len(dfi.loc[dfi[res_col_b] > 0]) - n_nodrone
 
-    no_drone['detection'] = np.logical_not(no_drone['no detection'])
     # flight restriction reasons for the sunburst chart
 
     # # number of no detected OHCA
@@ -311,78 +209,22 @@ def _compute_drone_time(
     #
     # n_detec_dw = n_detec_wit - n_detec_both
 
-    # Create data-frame used by getSankey function
-    if not input_jour:
-        cols_sankey = ['Intervention', 'Detection', 'Nuit', 'Témoin', 'Drone', 'Total']
-        df_sankey = pd.DataFrame(columns=cols_sankey, index=df_res.index)
-        index_nuit_cp = copy.deepcopy(index_nuit)
-        rate_nuit = int(np.round(100 * index_nuit_cp.sum() / len(index_nuit_cp), 0))
-        index_nuit_cp = np.where(index_nuit_cp, str(rate_nuit) + '% ' + _('Night'), index_nuit_cp)
-        index_nuit_cp = np.where(index_nuit_cp == 'False',
-                                 str(100 - rate_nuit) + '% ' + _('Day'), index_nuit_cp)
-        df_sankey['Nuit'] = index_nuit_cp
-
-    else:
-        cols_sankey = ['Intervention', 'Detection', 'Nuit', 'Témoin', 'Drone', 'Total']
-        df_sankey = pd.DataFrame(columns=cols_sankey, index=df_res.index)
-
-    df_sankey['Intervention'] = _('All incidents')
-    df_sankey['Total'] = 0
-
-    index_detec_cp = copy.deepcopy(np.logical_or(index_detec_rate_vp, index_detec_home))
-    rate_ndetec = int(np.round(100 * index_detec_cp.sum() / len(index_detec_cp), 0))
-    index_detec_cp = np.where(index_detec_cp,
-                              str(rate_ndetec) + '% ' + _('OHCA undeteced'), index_detec_cp)
-    index_detec_cp = np.where(index_detec_cp == 'False',
-                              str(100 - rate_ndetec) + '% ' + _('OHCA Detected'),
-                              index_detec_cp)
-    df_sankey['Detection'] = index_detec_cp
-
-    index_temoin_cp = copy.deepcopy(index_witness)
-    rate_temoin = int(np.round(100 * index_temoin_cp.sum() / len(index_temoin_cp), 0))
-    index_temoin_cp = np.where(index_temoin_cp,
-                               str(rate_temoin) + '% ' + _('Not enough witnesses'), index_temoin_cp)
-    index_temoin_cp = np.where(index_temoin_cp == 'False',
-                               str(100 - rate_temoin) + '% ' + _('Enough witnesses'),
-                               index_temoin_cp)
-    df_sankey['Témoin'] = index_temoin_cp
-
-    index_nodrone = dfi[res_col_a] == 0
-    index_bls = (dfi[res_col_b] >= 0) & (dfi[res_col_a] > 0)
-    index_drone = dfi[res_col_b] < 0
-
-    rate_drone = int(np.round(100 * index_drone.sum() / len(index_drone), 0))
-    rate_bls = int(np.round(100 * index_bls.sum() / len(index_bls), 0))
-    index_drone = np.where(index_drone, str(rate_drone) + '% ' + _('Drone faster'), index_drone)
-    index_drone = np.where(index_bls, str(rate_bls) + '% ' + _('BLS team faster'), index_drone)
-    index_drone = np.where(index_nodrone,
-                           str(100 - rate_drone - rate_bls) + '% ' + _('No drone'), index_drone)
-    df_sankey['Drone'] = index_drone
-
-    if not input_jour:
-        dftest = df_sankey.groupby(['Intervention', 'Detection', 'Nuit', 'Témoin', 'Drone']) \
-            .agg({'Total': 'count'})
-        dftest.reset_index(inplace=True)
-        sankey_data = genSankey(dftest,
-                                cat_cols=['Intervention', 'Detection', 'Nuit', 'Témoin', 'Drone'],
-                                value_cols='Total')
-    else:
-        dftest = df_sankey.groupby(['Intervention', 'Detection', 'Témoin', 'Drone']) \
-            .agg({'Total': 'count'})
-        dftest.reset_index(inplace=True)
-        sankey_data = genSankey(dftest,
-                                cat_cols=['Intervention', 'Detection', 'Témoin', 'Drone'],
-                                value_cols='Total')
-
-    trace1 = sankey_data
+    trace1, drone_rates = diagrams.create_sankey(result, with_night=not input_jour)
+    instrumentation.lap(report, 'sankey')
 
+    # One slice by outcome of the drone, as the last nodes of the Sankey diagram.
     trace2 = \
         go.Pie(labels=[_('Drone is faster'),
                        _('BLS team is faster'),
-                       _('Drone cannot fly')],
-               values=[rate_drone, rate_bls, (100 - rate_drone - rate_bls)],
-               pull=[0.2, 0, 0],
-               marker_colors=['rgba(0,128,0,0.8)', 'rgba(222,45,38,0.8)', 'rgba(186,190,222,1)'])
+                       _('Drone cannot fly'),
+                       _('No drone available'),
+                       _('No drone sent by the dispatch policy')],
+               values=[drone_rates[outcome] for outcome in (
+                   flows.DRONE_FASTER, flows.BLS_FASTER, flows.NO_DRONE, flows.NO_DRONE_AVAILABLE,
+                   flows.DECLINED)],
+               pull=[0.2, 0, 0, 0, 0],
+               marker_colors=['rgba(0,128,0,0.8)', 'rgba(222,45,38,0.8)', 'rgba(186,190,222,1)',
+                              'rgba(100,100,100,0.8)', 'rgba(255,212,59,0.8)'])
 
     # trace1 = go.Bar(
     #     x=[0, 1, 2],
@@ -393,15 +235,21 @@ def _compute_drone_time(
     # )
 
     # for the histogram graph
-    df_density = copy.deepcopy(dfi)
-    df_density = df_density.loc[df_density[res_col_a] > 0]
-
-    trace3 = go.Histogram(x=df_density[col_BLS_time],
-                          name=_('BLS team'),
-                          marker_color='#ff5959')
-    trace4 = go.Histogram(x=df_density[res_col_a],
-                          name=_('Drone'),
-                          marker_color='#49beb7')
+    df_density = dfi.loc[dfi[res_col_a] > 0]
+
+    if len(df_density) > aggregation.MAX_RAW_POINTS:
+        # Bin values on the server rather than sending them all to the browser.
+        bins, (bls_counts, drone_counts) = aggregation.histogram(
+            [df_density[simulation.col_BLS_time], df_density[res_col_a]])
+        trace3 = go.Bar(x=bins, y=bls_counts, name=_('BLS team'), marker_color='#ff5959')
+        trace4 = go.Bar(x=bins, y=drone_counts, name=_('Drone'), marker_color='#49beb7')
+    else:
+        trace3 = go.Histogram(x=df_density[simulation.col_BLS_time],
+                              name=_('BLS team'),
+                              marker_color='#ff5959')
+        trace4 = go.Histogram(x=df_density[res_col_a],
+                              name=_('Drone'),
+                              marker_color='#49beb7')
 
     # for the butterfly graph
     dfi['res_col_c'] = np.around(np.abs(dfi[res_col_b]), 0)
@@ -409,33 +257,51 @@ def _compute_drone_time(
     dfi.loc[dfi[res_col_b] < 0, 'wins'] = 'D'  # drone faster
     dfi.loc[dfi[res_col_a] == 0, 'wins'] = 'N'  # no drone
 
-    dfi.loc[dfi['wins'] == 'D', 'text'] = \
+    dfi[res_col_b] = - dfi[res_col_b]
+    ynew = dfi.sort_values(res_col_b)
+    x_bars = [i for i in range(0, len(dfi))]
+    if len(ynew) > aggregation.MAX_RAW_POINTS:
+        # Only keep some incidents of each kind, evenly spread along the sorted curve.
+        x_bars = aggregation.downsample_by_category(ynew['wins'].values)
+        ynew = ynew.iloc[x_bars].copy()
+
+    ynew.loc[ynew['wins'] == 'D', 'text'] = \
         _('<b>Drone faster</b> <br> by: ') + \
-        dfi.loc[dfi['wins'] == 'D', 'res_col_c'].map(str)
-    dfi.loc[dfi['wins'] == 'B', 'text'] = \
+        ynew.loc[ynew['wins'] == 'D', 'res_col_c'].map(str)
+    ynew.loc[ynew['wins'] == 'B', 'text'] = \
         _('<b>BLS team faster</b> <br> by: ') + \
-        dfi.loc[dfi['wins'] == 'B', 'res_col_c'].map(str)
-    dfi.loc[dfi['wins'] == 'N', 'text'] = \
+        ynew.loc[ynew['wins'] == 'B', 'res_col_c'].map(str)
+    ynew.loc[ynew['wins'] == 'N', 'text'] = \
         _('<b>No drone</b> <br> BLS team time to arrival: ') + \
-        dfi.loc[dfi['wins'] == 'N', 'res_col_c'].map(str)
+        ynew.loc[ynew['wins'] == 'N', 'res_col_c'].map(str)
 
-    dfi.loc[dfi['wins'] == 'D', 'col_bar'] = 'rgba(0,128,0,0.8)'
-    dfi.loc[dfi['wins'] == 'B', 'col_bar'] = 'rgba(222,45,38,0.8)'
-    dfi.loc[dfi['wins'] == 'N', 'col_bar'] = 'rgba(186,190,222,1)'
+    ynew.loc[ynew['wins'] == 'D', 'col_bar'] = 'rgba(0,128,0,0.8)'
+    ynew.loc[ynew['wins'] == 'B', 'col_bar'] = 'rgba(222,45,38,0.8)'
+    ynew.loc[ynew['wins'] == 'N', 'col_bar'] = 'rgba(186,190,222,1)'
 
-    dfi[res_col_b] = - dfi[res_col_b]
-    ynew = dfi.sort_values(res_col_b)
     list_col = list(ynew['col_bar'])
     list_text = list(ynew['text'])
 
-    trace5 = go.Bar(
-        x=[i for i in range(0, len(dfi))],
-        y=ynew[res_col_b],
-        name='',
-        marker=dict(color=list_col),
-        text=list_text,
-        hovertemplate='%{text} seconds',  # %{y} seconds',
-    )
+    if len(dfi) > aggregation.MAX_RAW_POINTS:
+        # Draw points with WebGL rather than a bar per incident.
+        trace5 = go.Scattergl(
+            x=x_bars,
+            y=ynew[res_col_b],
+            name='',
+            mode='markers',
+            marker=dict(color=list_col, size=4),
+            text=list_text,
+            hovertemplate='%{text} seconds',
+        )
+    else:
+        trace5 = go.Bar(
+            x=x_bars,
+            y=ynew[res_col_b],
+            name='',
+            marker=dict(color=list_col),
+            text=list_text,
+            hovertemplate='%{text} seconds',  # %{y} seconds',
+        )
 
     indicator_graphic_1 = {
         'data': [trace1],
@@ -503,18 +369,105 @@ def _compute_drone_time(
         }
     }
 
-    return indicator_graphic_3, indicator_graphic_4, \
-        indicator_graphic_3, indicator_graphic_4, \
-        indicator_graphic_1, indicator_graphic_1, indicator_graphic_2, \
-        indicator_graphic_2
+    instrumentation.lap(report, 'figures')
+
+    return indicator_graphic_1, indicator_graphic_2, indicator_graphic_3, indicator_graphic_4
+
+
+def _figures_key(params_hash_value):
+    """Key of the figures of a simulation in the result cache."""
+    return f'figures-v3-{params_hash_value}'
+
+
+def _cached_drone_time(*args, on_stage=None):
+    """Computes drone simulated flights, or get them from the cache if they were already computed
+    for the same parameters, see _compute_drone_time.
+
+    :param on_stage: (callable) called with the name of each stage when it ends, see
+        instrumentation.RunReport.
+
+    :return: the graphs, and the report of the time and memory used by each stage.
+    """
+    with instrumentation.RunReport('simulation', on_stage=on_stage) as report:
+        with instrumentation.profile_once('simulation'):
+            # The hash is computed again here rather than trusting the one sent by the browser.
+            figures = _RESULT_CACHE.get_or_compute(
+                _figures_key(_compute_params_hash(*args, None)),
+                functools.partial(_compute_figures_json, *args, report=report))
+        report.lap('cache')
+    return figures, report
+
+
+def _compute_figures_json(*args, report=None):
+    """Computes drone simulated flights, as plain JSON data that is much faster to cache than
+    Plotly objects.
+    """
+    figures = _compute_drone_time(*args, report=report)
+    figures_json = json.loads(json.dumps(figures, cls=plotly.utils.PlotlyJSONEncoder))
+    instrumentation.lap(report, 'serialize')
+    return figures_json
+
+
+def _run_drone_time_job(args, job):
+    return _cached_drone_time(*args, on_stage=job.report_stage)
+
+
+def _poll_drone_time(channel, tabs, active_tab, stored, *args):
+    """Start computing drone simulated flights in the background, or get their progress.
+
+    :param channel: (str) the tab of a browser page asking for the simulation: a simulation is
+        cancelled when the tab that asked for it asks for another one.
+    :param tabs: (tuple) ids of the tabs of the app showing the simulation: it is only computed
+        when one of them is active.
+    :param active_tab: (str) id of the active tab of the app.
+    :param stored: (dict) the simulation already sent to the browser, if any.
+
+    Other parameters are the ones of _compute_drone_time.
+
+    :return: the simulation to store in the browser (its hash and figures) and its debug report if
+        it is done, its progress, and whether to stop polling for it.
+    """
+    if active_tab not in tabs:
+        # Stop polling, until the simulation is shown again.
+        return no_update, no_update, no_update, True
+    params_hash_value = _compute_params_hash(*args, None)
+    if stored and stored['hash'] == params_hash_value:
+        raise exceptions.PreventUpdate()
+    if params_hash_value not in _JOBS and \
+            _RESULT_CACHE.is_computing(_figures_key(params_hash_value)):
+        # Another worker of the server runs it: wait for its result in the shared cache rather
+        # than holding a job thread waiting for it.
+        _JOBS.watch(channel, params_hash_value)
+        progress = dbc.Progress(
+            _('Running simulation: ') + _('in another worker'), value=0, striped=True,
+            animated=True)
+        return no_update, no_update, progress, False
+    job = _JOBS.submit(
+        channel, params_hash_value,
+        functools.partial(_run_drone_time_job, args), stages=_SIMULATION_STAGES)
+    concurrent.futures.wait([job.future], timeout=_JOB_WAIT)
+    if not job.future.done():
+        progress = dbc.Progress(
+            _('Running simulation: ') + str(job.current_stage), value=100 * job.progress,
+            striped=True, animated=True)
+        return no_update, no_update, progress, False
+    try:
+        figures, report = job.future.result()
+    except (jobs.Cancelled, concurrent.futures.CancelledError):
+        # Superseded by another simulation: the next poll starts it again if still needed.
+        return no_update, no_update, None, False
+    except Exception:  # pylint: disable=broad-except
+        _LOGGER.exception('Simulation failed')
+        return no_update, no_update, html.Div(_('Simulation failed')), True
+    return {'hash': params_hash_value, 'figures': figures}, report.format(), None, True
 
 
 @app.callback(
     Output('hash', 'value'),
-    [Input('seq_start', 'n_clicks'), Input('app-tabs', 'active_tab')],
+    [Input('seq_start', 'n_clicks')],
     [State('input_drone', 'value'),
      State('upload-starting-points', 'contents'),
-     State('upload-incidents', 'contents'),
+     State('incidents-digest', 'data'),
      State('speed', 'value'),
      State('acc', 'value'),
      State('vert-acc', 'value'),
@@ -527,18 +480,19 @@ def _compute_drone_time(
      State('wit_detec', 'value'),
      State('detec_rate_vp', 'value'),
      State('unavail_delta', 'value'),
+     State('dispatch_policy', 'value'),
      State('lang', 'value'),
      State('hash', 'value')])
-def params_hash(unused_seq_start, unused_active_tab, *args):
+def params_hash(unused_seq_start, *args):
     return _compute_params_hash(*args)
 
 
 @app.callback(
     Output('hash_b', 'value'),
-    [Input('seq_start_b', 'n_clicks'), Input('app-tabs', 'active_tab')],
+    [Input('seq_start_b', 'n_clicks')],
     [State('input_drone_b', 'value'),
      State('upload-starting-points', 'contents'),
-     State('upload-incidents', 'contents'),
+     State('incidents-digest', 'data'),
      State('speed_b', 'value'),
      State('acc_b', 'value'),
      State('vert-acc_b', 'value'),
@@ -551,23 +505,24 @@ def params_hash(unused_seq_start, unused_active_tab, *args):
      State('wit_detec_b', 'value'),
      State('detec_rate_vp_b', 'value'),
      State('unavail_delta_b', 'value'),
+     State('dispatch_policy_b', 'value'),
      State('lang', 'value'),
      State('hash_b', 'value')])
-def params_hash_b(unused_seq_start, unused_active_tab, *args):
+def params_hash_b(unused_seq_start, *args):
     return _compute_params_hash(*args)
 
 
 def _compute_params_hash(
-        drone_input, custom_drone_input, custom_incidents_csv,
+        drone_input, custom_drone_input, incidents_digest,
         input_speed, input_acc, vert_acc, alt, dep_delay, arr_delay, detec_delay,
-        input_jour, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta, lang,
-        previous_hash):
+        input_jour, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta,
+        dispatch_policy, lang, previous_hash):
     combined = hashlib.sha1()
     combined.update(str(drone_input).encode('utf-8'))
     if custom_drone_input:
         combined.update(str(custom_drone_input).encode('utf-8'))
-    if custom_incidents_csv:
-        combined.update(str(custom_incidents_csv).encode('utf-8'))
+    if incidents_digest:
+        combined.update(str(incidents_digest).encode('utf-8'))
     combined.update(str(input_speed).encode('utf-8'))
     combined.update(str(input_acc).encode('utf-8'))
     combined.update(str(vert_acc).encode('utf-8'))
@@ -580,6 +535,7 @@ def _compute_params_hash(
     combined.update(str(no_witness_rate).encode('utf-8'))
     combined.update(str(detec_rate_vp).encode('utf-8'))
     combined.update(str(unavail_delta).encode('utf-8'))
+    combined.update(str(dispatch_policy).encode('utf-8'))
     if lang:
         combined.update(str(lang).encode('utf-8'))
     new_hash = combined.hexdigest()
@@ -589,18 +545,17 @@ def _compute_params_hash(
 
 
 @app.callback(
-    [Output('indicator-graphic3', 'figure'),
-     Output('indicator-graphic4', 'figure'),
-     Output('indicator-graphic3u', 'figure'),
-     Output('indicator-graphic4u', 'figure'),
-     Output('indicator-graphic1', 'figure'),
-     Output('indicator-graphic1u', 'figure'),
-     Output('indicator-graphic2', 'figure'),
-     Output('indicator-graphic2u', 'figure')],
-    [Input('hash', 'value')],
-    [State('input_drone', 'value'),
+    [Output('simulation', 'data'),
+     Output('debug-panel', 'children'),
+     Output('job-status', 'children'),
+     Output('job-poll', 'disabled')],
+    [Input('hash', 'value'), Input('job-poll', 'n_intervals'),
+     Input('app-tabs', 'active_tab')],
+    [State('simulation', 'data'),
+     State('session-id', 'data'),
+     State('input_drone', 'value'),
      State('upload-starting-points', 'contents'),
-     State('upload-incidents', 'contents'),
+     State('incidents-digest', 'data'),
      State('speed', 'value'),
      State('acc', 'value'),
      State('vert-acc', 'value'),
@@ -613,106 +568,54 @@ def _compute_params_hash(
      State('wit_detec', 'value'),
      State('detec_rate_vp', 'value'),
      State('unavail_delta', 'value'),
+     State('dispatch_policy', 'value'),
      State('lang', 'value')])
 def drone_time(
-        unused_hash_value,
-        drone_input, custom_drone_input, custom_incidents_csv,
+        unused_hash_value, unused_n_intervals, active_tab, stored, session_id,
+        drone_input, custom_drone_input, incidents_digest,
         input_speed, input_acc, vert_acc, alt, dep_delay, arr_delay, detec_delay,
-        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta, lang):
-    return _compute_drone_time(
-        drone_input, custom_drone_input, custom_incidents_csv,
+        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta,
+        dispatch_policy, lang):
+    return _poll_drone_time(
+        f'{session_id}', ('simA', 'sims'), active_tab, stored,
+        drone_input, custom_drone_input, incidents_digest,
         input_speed, input_acc, vert_acc, alt, dep_delay, arr_delay, detec_delay,
-        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta, lang)
-
-
-def genSankey(df, cat_cols, value_cols=''):
-
-    # maximum of 6 value cols -> 6 colors
-    colorPalette = ['#4B8BBE', '#306998', '#FFE873', '#FFD43B', '#646464']
-    labelList = []
-    colorNumList = []
-    for catCol in cat_cols:
-        labelListTemp = list(set(df[catCol].values))
-        colorNumList.append(len(labelListTemp))
-        labelList = labelList + labelListTemp
-
-    # remove duplicates from labelList
-    labelList = list(dict.fromkeys(labelList))
-
-    # define colors based on number of levels
-    colorList = []
-    for idx, colorNum in enumerate(colorNumList):
-        colorList = colorList + [colorPalette[idx]] * colorNum
-
-    # transform df into a source-target pair
-    for i in range(len(cat_cols) - 1):
-        if i == 0:
-            sourceTargetDf = df[[cat_cols[i], cat_cols[i + 1], value_cols]]
-            sourceTargetDf.columns = ['source', 'target', 'count']
-        else:
-            tempDf = df[[cat_cols[i], cat_cols[i + 1], value_cols]]
-            tempDf.columns = ['source', 'target', 'count']
-            sourceTargetDf = pd.concat([sourceTargetDf, tempDf])
-        sourceTargetDf = sourceTargetDf.groupby(['source', 'target']) \
-            .agg({'count': 'sum'}).reset_index()
-
-    # add index for source-target pair
-    sourceTargetDf['sourceID'] = sourceTargetDf['source'].apply(labelList.index)
-    sourceTargetDf['targetID'] = sourceTargetDf['target'].apply(labelList.index)
-
-    # add column for source-node-conditional count to retrieve rates
-    sourceTargetDf['cond_count'] = 0
-    for i in sourceTargetDf['sourceID'].unique():
-        s = sourceTargetDf[sourceTargetDf.sourceID == i]['count'].sum()
-        sourceTargetDf.loc[sourceTargetDf['sourceID'] == i, ['cond_count']] = s
-
-    labelsDf = ((100 * sourceTargetDf['count'] / sourceTargetDf['cond_count'])
-                .round(decimals=1)).astype(str) + '%'
-
-    # creating the sankey diagram
-    data = go.Sankey(
-        node=dict(
-            pad=15,
-            thickness=30,
-            line=dict(
-                color='black',
-                width=1
-            ),
-            label=labelList,
-            color=colorList
-        ),
-        orientation='v',
-        link=dict(
-            source=sourceTargetDf['sourceID'],
-            target=sourceTargetDf['targetID'],
-            value=sourceTargetDf['count'],
-            label=labelsDf
-        ),
-    )
-    #
-    # layout = dict(
-    #     title=title,
-    #     font=dict(
-    #         size=10
-    #     )
-    # )
-
-    return data
+        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta,
+        dispatch_policy, lang)
+
+
+# Fill the graphs of a simulation from its figures stored in the browser, only in the active tab:
+# the figures are sent once for both copies of the graphs, and hidden graphs are not rendered.
+_SHOW_FIGURES = '''
+function(simulation, activeTab) {
+    var noUpdate = window.dash_clientside.no_update;
+    var hidden = [noUpdate, noUpdate, noUpdate, noUpdate];
+    var figures = simulation ? simulation.figures : hidden;
+    return (activeTab === '%s' ? figures : hidden).concat(
+        activeTab === 'sims' ? figures : hidden);
+}
+'''
+
+for _suffix, _tab in (('', 'simA'), ('_b', 'simB')):
+    app.clientside_callback(
+        _SHOW_FIGURES % _tab,
+        [Output(f'indicator-graphic{graph}{_suffix}', 'figure') for graph in range(1, 5)] +
+        [Output(f'indicator-graphic{graph}u{_suffix}', 'figure') for graph in range(1, 5)],
+        [Input(f'simulation{_suffix}', 'data'), Input('app-tabs', 'active_tab')])
 
 
 @app.callback(
-    [Output('indicator-graphic3_b', 'figure'),
-     Output('indicator-graphic4_b', 'figure'),
-     Output('indicator-graphic3u_b', 'figure'),
-     Output('indicator-graphic4u_b', 'figure'),
-     Output('indicator-graphic1_b', 'figure'),
-     Output('indicator-graphic1u_b', 'figure'),
-     Output('indicator-graphic2_b', 'figure'),
-     Output('indicator-graphic2u_b', 'figure')],
-    [Input('hash_b', 'value')],
-    [State('input_drone_b', 'value'),
+    [Output('simulation_b', 'data'),
+     Output('debug-panel_b', 'children'),
+     Output('job-status_b', 'children'),
+     Output('job-poll_b', 'disabled')],
+    [Input('hash_b', 'value'), Input('job-poll_b', 'n_intervals'),
+     Input('app-tabs', 'active_tab')],
+    [State('simulation_b', 'data'),
+     State('session-id', 'data'),
+     State('input_drone_b', 'value'),
      State('upload-starting-points', 'contents'),
-     State('upload-incidents', 'contents'),
+     State('incidents-digest', 'data'),
      State('speed_b', 'value'),
      State('acc_b', 'value'),
      State('vert-acc_b', 'value'),
@@ -725,16 +628,20 @@ def genSankey(df, cat_cols, value_cols=''):
      State('wit_detec_b', 'value'),
      State('detec_rate_vp_b', 'value'),
      State('unavail_delta_b', 'value'),
+     State('dispatch_policy_b', 'value'),
      State('lang', 'value')])
 def drone_time_b(
-        unused_seq_start,
-        drone_input, custom_drone_input, custom_incidents_csv,
+        unused_hash_value, unused_n_intervals, active_tab, stored, session_id,
+        drone_input, custom_drone_input, incidents_digest,
         input_speed, input_acc, vert_acc, alt, dep_delay, arr_delay, detec_delay,
-        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta, lang):
-    return _compute_drone_time(
-        drone_input, custom_drone_input, custom_incidents_csv,
+        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta,
+        dispatch_policy, lang):
+    return _poll_drone_time(
+        f'{session_id}_b', ('simB', 'sims'), active_tab, stored,
+        drone_input, custom_drone_input, incidents_digest,
         input_speed, input_acc, vert_acc, alt, dep_delay, arr_delay, detec_delay,
-        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta, lang)
+        input_jour_, detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta,
+        dispatch_policy, lang)
 
 
 @app.callback(
@@ -753,10 +660,20 @@ def custom_starting_points(contents, filename):
 
 @app.callback(
     [Output('output-incidents-upload', 'children'),
-     Output('unused', 'value')],
+     Output('incidents-digest', 'data')],
     [Input('upload-incidents', 'contents')],
-    [State('upload-incidents', 'filename')])
-def custom_incidents(contents, filename):
+    [State('upload-incidents', 'filename'),
+     State('lang', 'value')])
+def custom_incidents(contents, filename, lang):
     if contents:
-        return html.Div(filename), 0
-    return None, 0
+        try:
+            with instrumentation.RunReport('upload') as report, report.stage('parse'):
+                digest = _DATASETS.add(contents)
+        except (ValueError, KeyError):
+            _LOGGER.exception('Invalid incidents file %s', filename)
+            if lang:
+                gettext.translation(
+                    'messages', localedir='locales', languages=[lang], fallback=True).install()
+            return html.Div(_('Invalid incidents file: ') + str(filename)), None
+        return html.Div(filename), digest
+    return None, None
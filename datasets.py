@@ -0,0 +1,205 @@
+"""Module storing incidents datasets, parsed once and then referred to by their digest."""
+
+import base64
+import collections
+import functools
+import hashlib
+import io
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+import simulation
+import snapshot
+
+_DEFAULT_INCIDENTS = 'data/dataACRtime_GPSCSPCpostime_v7.csv'
+_DEFAULT_INCIDENTS_SNAPSHOT = 'incidents'
+
+_DIGEST_PATTERN = re.compile('[0-9a-f]{40}')
+
+# Format of the datetimes in CSV files of incidents, e.g. 31/12/17 23:59.
+TIME_FORMAT = '%d/%m/%y %H:%M'
+
+# Fields of CSV files of incidents read by the simulation, with their type. Flags are read as
+# floats to keep missing values, see simulation.IncidentTable.from_frame.
+_INCIDENTS_SCHEMA = {
+    simulation.col_time_em_call: str,
+    simulation.col_BLS_time: np.float64,
+    simulation.col_indic_day: np.float32,
+    simulation.col_indic_wind: np.float32,
+    simulation.col_indic_sight: np.float32,
+    simulation.col_indic_home: np.float32,
+    simulation.col_lat_inter: np.float64,
+    simulation.col_lon_inter: np.float64,
+}
+
+# Number of rows of a CSV file of incidents parsed at once.
+_CHUNK_ROWS = 100000
+
+
+def parse_incidents(incidents_csv, encoding='latin-1', chunk_rows=_CHUNK_ROWS):
+    """
+    Parse a CSV file of incidents.
+
+    The file is parsed by chunks, and each chunk is filtered and converted at once, so that
+    memory stays bounded even for large files.
+
+    :param incidents_csv: a path or a file-like object of a CSV file, see the Custom Datasets tab
+        for the expected fields.
+    :param encoding: (str) encoding of the file.
+    :param chunk_rows: (int) number of rows parsed at once.
+
+    :return: (simulation.IncidentTable) incidents whose BLS team time to arrival is between 0 and
+        25 minutes.
+
+    :raise ValueError: if fields are missing or cannot be parsed.
+    """
+    tables = []
+    chunks = pd.read_csv(
+        incidents_csv, encoding=encoding, usecols=list(_INCIDENTS_SCHEMA),
+        dtype=_INCIDENTS_SCHEMA, chunksize=chunk_rows)
+    for chunk in chunks:
+        bls_time = chunk[simulation.col_BLS_time]
+        chunk = chunk.loc[(bls_time >= 0) & (bls_time <= 25 * 60)]
+        tables.append(simulation.IncidentTable.from_frame(chunk.assign(**{
+            simulation.col_time_em_call: _parse_times(chunk[simulation.col_time_em_call]),
+        })))
+    return simulation.IncidentTable.concatenate(tables)
+
+
+def _parse_times(times):
+    # Datetimes in another format than TIME_FORMAT are inferred, much slower, days first.
+    try:
+        return pd.to_datetime(times, format=TIME_FORMAT)
+    except ValueError:
+        return pd.to_datetime(times, dayfirst=True)
+
+
+@functools.lru_cache(1)
+def load_default_incidents():
+    """Load the incidents gathered in 2017 by Paris' Firefighters, from their snapshot if it is
+    up to date.
+
+    :return: (simulation.IncidentTable) the incidents.
+    """
+    columns = snapshot.load(_DEFAULT_INCIDENTS_SNAPSHOT, [_DEFAULT_INCIDENTS], mmap_mode='r')
+    if columns is None:
+        return save_default_snapshot()
+    return simulation.IncidentTable(**columns)
+
+
+def save_default_snapshot():
+    """Parse the incidents gathered in 2017 by Paris' Firefighters, and save them in a snapshot.
+
+    :return: (simulation.IncidentTable) the incidents.
+    """
+    incidents = parse_incidents(_DEFAULT_INCIDENTS)
+    snapshot.save(_DEFAULT_INCIDENTS_SNAPSHOT, [_DEFAULT_INCIDENTS], _columns(incidents))
+    return incidents
+
+
+def _columns(incidents):
+    return {name: getattr(incidents, name) for name in simulation.IncidentTable.__slots__}
+
+
+def _decode_upload(contents):
+    """Extract the content of a file uploaded with the dcc.Upload component.
+
+    The input format is like "data:text/csv;base64,Q09ACzer324..."
+    """
+    return base64.b64decode(contents.split(',')[1])
+
+
+class DatasetStore:
+    """A content-addressed store of parsed incidents datasets.
+
+    Datasets are kept parsed, as compact simulation.IncidentTable, in memory under a byte budget,
+    least recently used first out, and saved in a local binary cache so that they are never parsed
+    twice, even after a restart. Datasets loaded from this cache are memory-mapped: processes
+    sharing the same cache folder share their memory.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None):
+        """
+        :param max_bytes: (int) memory budget for the parsed datasets.
+        :param disk_dir: (str) directory where to save parsed datasets, None to keep them in memory
+            only.
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._datasets = collections.OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, digest):
+        return os.path.join(self.disk_dir, digest)
+
+    def _keep_in_memory(self, digest, incidents):
+        size = incidents.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if digest in self._datasets:
+                return
+            self._datasets[digest] = (incidents, size)
+            self._num_bytes += size
+            while self._num_bytes > self.max_bytes:
+                unused_digest, (unused_incidents, evicted_size) = \
+                    self._datasets.popitem(last=False)
+                self._num_bytes -= evicted_size
+
+    def __contains__(self, digest):
+        with self._lock:
+            if digest in self._datasets:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._disk_path(digest))
+
+    def add(self, contents):
+        """
+        Add an uploaded dataset to the store, if it is not already there.
+
+        :param contents: (str) the content of a file uploaded with the dcc.Upload component.
+
+        :return: (str) the digest of the dataset, to get it back later.
+        """
+        decoded = _decode_upload(contents)
+        digest = hashlib.sha1(decoded).hexdigest()
+        if digest in self:
+            return digest
+        incidents = parse_incidents(io.BytesIO(decoded), encoding='utf-8')
+        self._keep_in_memory(digest, incidents)
+        if self.disk_dir:
+            snapshot.write_arrays(self._disk_path(digest), _columns(incidents))
+        return digest
+
+    def get(self, digest):
+        """
+        Get a dataset from the store.
+
+        :param digest: (str) the digest of a dataset returned by add, or None for the default
+            dataset.
+
+        :return: (simulation.IncidentTable) the incidents, shared by all callers.
+        """
+        if not digest:
+            return load_default_incidents()
+        if not _DIGEST_PATTERN.fullmatch(digest):
+            raise KeyError(f'Invalid dataset digest "{digest}"')
+        with self._lock:
+            if digest in self._datasets:
+                self._datasets.move_to_end(digest)
+                return self._datasets[digest][0]
+        if not self.disk_dir:
+            raise KeyError(f'Unknown dataset "{digest}", it should be uploaded again')
+        try:
+            columns, unused_metadata = snapshot.read_arrays(self._disk_path(digest), mmap_mode='r')
+        except FileNotFoundError as error:
+            raise KeyError(f'Unknown dataset "{digest}", it should be uploaded again') from error
+        incidents = simulation.IncidentTable(**columns)
+        self._keep_in_memory(digest, incidents)
+        return incidents
@@ -0,0 +1,78 @@
+"""Module creating diagrams of the web app from the outcome of a simulation, without the app itself.
+
+Labels are translated with the _ function installed by gettext.
+"""
+
+import numpy as np
+import plotly.graph_objects as go
+
+import flows
+
+# Colors of the nodes of each stage of the Sankey diagram.
+_SANKEY_COLORS = ['#4B8BBE', '#306998', '#FFE873', '#FFD43B', '#646464']
+
+
+def _stage_rates(counts, remainder):
+    # Rates in integer %, the remainder outcome gets what is left so that they sum to 100.
+    rates = np.round(100 * counts / max(1, counts.sum())).astype(int)
+    rates[remainder] = 100 - (rates.sum() - rates[remainder])
+    return rates
+
+
+def create_sankey(result, with_night=True):
+    """
+    Create the Sankey diagram of the outcomes of a simulation, by stage.
+
+    Flows are counted from the outcome codes of each stage (see flows.stage_outcomes), only the
+    labels of the nodes are translated.
+
+    :param result: (simulation.SimulationResult) the outcome of a simulation.
+    :param with_night: (bool) whether to include the night stage.
+
+    :return: (go.Sankey, np.array) the diagram, and the rates (integer %) of the outcomes of the
+        drone stage, see flows.drone_outcomes.
+    """
+    codes, num_outcomes = flows.stage_outcomes(result, with_night)
+    names = [[_('All incidents')], [_('OHCA Detected'), _('OHCA undeteced')]]
+    if with_night:
+        names.append([_('Day'), _('Night')])
+    names.append([_('Enough witnesses'), _('Not enough witnesses')])
+    names.append([None] * flows.NUM_DRONE_OUTCOMES)
+    names[-1][flows.DRONE_FASTER] = _('Drone faster')
+    names[-1][flows.BLS_FASTER] = _('BLS team faster')
+    names[-1][flows.NO_DRONE] = _('No drone')
+    names[-1][flows.NO_DRONE_AVAILABLE] = _('No drone available')
+    names[-1][flows.DECLINED] = _('No drone sent by the dispatch policy')
+    remainders = [0] * (len(names) - 1) + [flows.NO_DRONE]
+
+    labels, colors, stage_rates = [], [], []
+    for stage, (stage_codes, stage_names) in enumerate(zip(codes, names)):
+        rates = _stage_rates(
+            np.bincount(stage_codes, minlength=len(stage_names)), remainders[stage])
+        stage_rates.append(rates)
+        labels += [f'{rate}% {name}' if stage else name for name, rate in zip(stage_names, rates)]
+        colors += [_SANKEY_COLORS[stage]] * len(stage_names)
+
+    source, target, value = flows.links(codes, num_outcomes)
+    # Only show the nodes with incidents.
+    nodes = np.unique(np.concatenate([source, target]))
+    cond_count = np.bincount(source, weights=value)[source]
+    return go.Sankey(
+        node=dict(
+            pad=15,
+            thickness=30,
+            line=dict(
+                color='black',
+                width=1
+            ),
+            label=[labels[node] for node in nodes],
+            color=[colors[node] for node in nodes]
+        ),
+        orientation='v',
+        link=dict(
+            source=np.searchsorted(nodes, source),
+            target=np.searchsorted(nodes, target),
+            value=value,
+            label=[f'{rate}%' for rate in np.round(100 * value / cond_count, 1)]
+        ),
+    ), stage_rates[-1]
@@ -0,0 +1,157 @@
+"""Module computing distances between incidents and drones starting points."""
+
+import numpy as np
+
+# Mean Earth radius in km, as used by geopy.distance.great_circle.
+EARTH_RADIUS = 6371.009
+
+# WGS-84 ellipsoid: semi-major axis in km and flattening.
+_WGS84_A = 6378.137
+_WGS84_F = 1 / 298.257223563
+_WGS84_B = _WGS84_A * (1 - _WGS84_F)
+
+# Maximum number of cells computed at once, to bound the memory of temporary arrays.
+_CHUNK_CELLS = 1 << 20
+
+
+def _as_coords(lat, lon):
+    lat = np.asarray(lat, dtype=float).ravel()
+    lon = np.asarray(lon, dtype=float).ravel()
+    invalid = ~np.isfinite(lat) | ~np.isfinite(lon) | (np.abs(lat) > 90)
+    return np.radians(lat), np.radians(lon), invalid
+
+
+def _haversine(phi_a, lambda_a, phi_b, lambda_b):
+    sin_dphi = np.sin((phi_b - phi_a) / 2)
+    sin_dlambda = np.sin((lambda_b - lambda_a) / 2)
+    hav = sin_dphi ** 2 + np.cos(phi_a) * np.cos(phi_b) * sin_dlambda ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(hav, 0, 1)))
+
+
+def _vincenty(phi_a, lambda_a, phi_b, lambda_b, max_iter=200, tol=1e-12):
+    """Vincenty's inverse formula on the WGS-84 ellipsoid.
+
+    :return: (np.array, np.array) distances in km, and a mask of the cells where the iteration did
+        not converge (nearly antipodal points).
+    """
+    f = _WGS84_F
+    u_a = np.arctan((1 - f) * np.tan(phi_a))
+    u_b = np.arctan((1 - f) * np.tan(phi_b))
+    sin_ua, cos_ua = np.sin(u_a), np.cos(u_a)
+    sin_ub, cos_ub = np.sin(u_b), np.cos(u_b)
+    delta_lambda = lambda_b - lambda_a
+    lambda_ = delta_lambda
+    converged = np.zeros(np.broadcast(phi_a, phi_b).shape, dtype=bool)
+
+    for unused_iter in range(max_iter):
+        sin_lambda, cos_lambda = np.sin(lambda_), np.cos(lambda_)
+        sin_sigma = np.hypot(
+            cos_ub * sin_lambda, cos_ua * sin_ub - sin_ua * cos_ub * cos_lambda)
+        cos_sigma = sin_ua * sin_ub + cos_ua * cos_ub * cos_lambda
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        sin_alpha = np.divide(
+            cos_ua * cos_ub * sin_lambda, sin_sigma,
+            out=np.zeros_like(sin_sigma), where=sin_sigma != 0)
+        cos2_alpha = 1 - sin_alpha ** 2
+        # Equatorial lines have cos2_alpha = 0, the term is then not used.
+        cos_2sigma_m = cos_sigma - np.divide(
+            2 * sin_ua * sin_ub, cos2_alpha,
+            out=np.copy(cos_sigma), where=cos2_alpha != 0)
+        c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        previous_lambda = lambda_
+        lambda_ = delta_lambda + (1 - c) * f * sin_alpha * (
+            sigma + c * sin_sigma * (
+                cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+        converged = np.abs(lambda_ - previous_lambda) < tol
+        if converged.all():
+            break
+
+    u2 = cos2_alpha * (_WGS84_A ** 2 - _WGS84_B ** 2) / _WGS84_B ** 2
+    big_a = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    big_b = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = big_b * sin_sigma * (
+        cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) *
+            (-3 + 4 * cos_2sigma_m ** 2)))
+    return _WGS84_B * big_a * (sigma - delta_sigma), ~converged
+
+
+def _check_method(method):
+    if method not in ('geodesic', 'haversine'):
+        raise ValueError(f'Unknown distance method "{method}"')
+
+
+def _distances(phi_a, lambda_a, phi_b, lambda_b, method):
+    if method == 'haversine':
+        return _haversine(phi_a, lambda_a, phi_b, lambda_b)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        res, not_converged = _vincenty(phi_a, lambda_a, phi_b, lambda_b)
+    not_converged &= np.isfinite(phi_a + lambda_a + phi_b + lambda_b)
+    if not not_converged.any():
+        return res
+    # Only needed for nearly antipodal points, imported here not to slow down the app startup.
+    import geopy.distance  # pylint: disable=import-outside-toplevel
+    for index in zip(*np.nonzero(not_converged)):
+        coords_a = np.broadcast_to(phi_a, res.shape)[index], \
+            np.broadcast_to(lambda_a, res.shape)[index]
+        coords_b = np.broadcast_to(phi_b, res.shape)[index], \
+            np.broadcast_to(lambda_b, res.shape)[index]
+        try:
+            res[index] = geopy.distance.geodesic(
+                np.degrees(coords_a), np.degrees(coords_b)).km
+        except ValueError:
+            res[index] = np.nan
+    return res
+
+
+def distance_matrix(lat_a, lon_a, lat_b, lon_b, method='geodesic'):
+    """
+    Compute the distances between all pairs of points from two sets of GPS locations.
+
+    :param lat_a: (np.array) latitudes (WGS84) of the first set of points, e.g. the incidents.
+    :param lon_a: (np.array) longitudes (WGS84) of the first set of points.
+    :param lat_b: (np.array) latitudes (WGS84) of the second set of points, e.g. the drones.
+    :param lon_b: (np.array) longitudes (WGS84) of the second set of points.
+    :param method: (str) 'geodesic' for the exact distance on the WGS-84 ellipsoid (same as
+        geopy.distance.geodesic), or 'haversine' for the faster great-circle approximation
+        (error below 0.5%).
+
+    :return: (np.array) a matrix of shape (len(lat_a), len(lat_b)) of distances in km, NaN when
+        one of the points is not a valid location.
+    """
+    _check_method(method)
+    phi_a, lambda_a, invalid_a = _as_coords(lat_a, lon_a)
+    phi_b, lambda_b, invalid_b = _as_coords(lat_b, lon_b)
+
+    res = np.empty((len(phi_a), len(phi_b)))
+    chunk = max(1, _CHUNK_CELLS // max(1, len(phi_b)))
+    for start in range(0, len(phi_a), chunk):
+        rows = slice(start, start + chunk)
+        res[rows] = _distances(
+            phi_a[rows, np.newaxis], lambda_a[rows, np.newaxis],
+            phi_b[np.newaxis, :], lambda_b[np.newaxis, :], method)
+
+    res[invalid_a, :] = np.nan
+    res[:, invalid_b] = np.nan
+    return res
+
+
+def paired_distances(lat_a, lon_a, lat_b, lon_b, method='geodesic'):
+    """
+    Compute the distances between pairs of GPS locations.
+
+    :param lat_a: (np.array) latitudes (WGS84) of the first point of each pair.
+    :param lon_a: (np.array) longitudes (WGS84) of the first point of each pair.
+    :param lat_b: (np.array) latitudes (WGS84) of the second point of each pair.
+    :param lon_b: (np.array) longitudes (WGS84) of the second point of each pair.
+    :param method: (str) 'geodesic' or 'haversine', see distance_matrix.
+
+    :return: (np.array) distances in km, NaN when one of the points is not a valid location.
+    """
+    _check_method(method)
+    phi_a, lambda_a, invalid_a = _as_coords(lat_a, lon_a)
+    phi_b, lambda_b, invalid_b = _as_coords(lat_b, lon_b)
+    res = _distances(phi_a, lambda_a, phi_b, lambda_b, method)
+    res[invalid_a | invalid_b] = np.nan
+    return res
@@ -2,8 +2,33 @@
 
 import numpy as np
 
+import snapshot
 
-STARTING_POINTS = {
-    'Postes de commandement': np.genfromtxt('data/coords_pc.csv', delimiter=',', dtype=str),
-    'Centres de secours': np.genfromtxt('data/coords_cs.csv', delimiter=',', dtype=str),
+# CSV files of the predefined starting points (name, latitude, longitude), by name.
+_STARTING_POINTS_FILES = {
+    'Postes de commandement': 'data/coords_pc.csv',
+    'Centres de secours': 'data/coords_cs.csv',
 }
+_SNAPSHOT = 'starting_points'
+
+
+def save_snapshot():
+    """Parse the predefined starting points, and save them in a snapshot.
+
+    :return: (dict) the starting points by name.
+    """
+    starting_points = {
+        name: np.genfromtxt(path, delimiter=',', dtype=str)
+        for name, path in _STARTING_POINTS_FILES.items()}
+    snapshot.save(_SNAPSHOT, list(_STARTING_POINTS_FILES.values()), starting_points)
+    return starting_points
+
+
+def _load_starting_points():
+    starting_points = snapshot.load(_SNAPSHOT, list(_STARTING_POINTS_FILES.values()))
+    if starting_points is None:
+        return save_snapshot()
+    return starting_points
+
+
+STARTING_POINTS = _load_starting_points()
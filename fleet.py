@@ -0,0 +1,259 @@
+"""Module simulating the availability of a fleet of drones along the incidents timeline."""
+
+import functools
+import heapq
+import os
+
+import numpy as np
+
+import process_pool
+
+_NANOSECONDS_PER_HOUR = 3600 * 10 ** 9
+
+# Index returned by a dispatch policy to send no drone although one is available, see dispatch.
+DECLINED = -2
+
+# Number of closest drones kept for each incident by ClosestInMatrix, and number of rows of the
+# distance matrix partitioned at once to find them.
+_NUM_CANDIDATES = 8
+_CHUNK_ROWS = 1 << 14
+
+# Number of shards of the timeline by worker process, to balance their load, see dispatch_sharded.
+_SHARDS_PER_WORKER = 4
+
+
+def as_timestamps(times):
+    """Convert datetimes to int64 timestamps in nanoseconds, cheap to compare and to sort."""
+    times = np.asarray(times)
+    if times.dtype == np.int64:
+        return times
+    return times.astype('datetime64[ns]').astype(np.int64)
+
+
+def hours_to_timedelta(hours):
+    """Convert a delay in hours to a timedelta in nanoseconds, see as_timestamps."""
+    return int(round(float(hours) * _NANOSECONDS_PER_HOUR))
+
+
+class ClosestInMatrix:
+    """Lookup of the closest available drone from a precomputed distance matrix.
+
+    The few closest drones of each incident are found and sorted for all incidents at once, so
+    that for each incident only they are checked until an available one is found. The whole row
+    is only scanned when they are all busy.
+    """
+
+    def __init__(self, dist_matrix, num_candidates=_NUM_CANDIDATES):
+        """
+        :param dist_matrix: (np.array) distances in km between incidents (rows) and drones
+            starting points (columns), NaN if a drone cannot reach an incident.
+        :param num_candidates: (int) number of closest drones kept for each incident.
+        """
+        self.dist_matrix = dist_matrix
+        self.available = np.ones(dist_matrix.shape[1], dtype=bool)
+        num_incidents, num_drones = dist_matrix.shape
+        num_candidates = min(num_candidates, num_drones)
+        self._complete = num_candidates == num_drones
+        self._order = np.empty((num_incidents, num_candidates), dtype=int)
+        for start in range(0, num_incidents, _CHUNK_ROWS):
+            rows = dist_matrix[start:start + _CHUNK_ROWS]
+            candidates = np.argpartition(rows, num_candidates - 1, axis=1)[:, :num_candidates] \
+                if not self._complete else np.tile(np.arange(num_drones), (len(rows), 1))
+            # By distance then by index, NaN distances last.
+            order = np.lexsort((candidates, np.take_along_axis(rows, candidates, axis=1)))
+            self._order[start:start + _CHUNK_ROWS] = np.take_along_axis(candidates, order, axis=1)
+        # Distance of the farthest candidate: other drones are at least as far.
+        self._last_dists = np.take_along_axis(dist_matrix, self._order[:, -1:], axis=1)[:, 0] \
+            if num_candidates else np.full(num_incidents, np.nan)
+
+    def mark_available(self, drone):
+        self.available[drone] = True
+
+    def mark_unavailable(self, drone):
+        self.available[drone] = False
+
+    def closest(self, incident):
+        """
+        Find the closest available drone to an incident.
+
+        :param incident: (int) index of the incident.
+
+        :return: (int) index of the drone, -1 if no drone is available.
+        """
+        for drone in self._order[incident]:
+            if self.available[drone]:
+                dist = self.dist_matrix[incident, drone]
+                if np.isnan(dist):
+                    return -1
+                # A drone left out as far as the last candidate might come first among ties.
+                if self._complete or not dist >= self._last_dists[incident]:
+                    return drone
+                break
+        else:
+            if self._complete:
+                return -1
+        return self._scan(incident)
+
+    def _scan(self, incident):
+        # Closest available drone among all of them, the first one among ties.
+        dists = np.where(self.available, self.dist_matrix[incident], np.nan)
+        if np.isnan(dists).all():
+            return -1
+        return int(np.nanargmin(dists))
+
+    def distances(self, incidents, drones):
+        """Distances in km between pairs of incidents and drones, given by their indices."""
+        return self.dist_matrix[incidents, drones]
+
+
+class Fleet:
+    """Availability of a fleet of drones.
+
+    Busy drones sit in a min-heap keyed by the time they become available again, so that releasing
+    them costs O(log n) each. Available drones are tracked by a locator (see ClosestInMatrix) which
+    finds the closest one to an incident.
+    """
+
+    def __init__(self, locator):
+        self.locator = locator
+        # A new fleet starts with all its drones available.
+        locator.available[:] = True
+        self._busy = []
+
+    def release(self, time):
+        """
+        Make available again all drones whose unavailability ended strictly before a given time.
+
+        :param time: (int) timestamp of the current incident.
+
+        :return: (list) indices of the released drones.
+        """
+        released = []
+        while self._busy and self._busy[0][0] < time:
+            unused_time, drone = heapq.heappop(self._busy)
+            self.locator.mark_available(drone)
+            released.append(drone)
+        return released
+
+    def launch(self, drone, until):
+        """
+        Make a drone unavailable.
+
+        :param drone: (int) index of the drone.
+        :param until: (int) timestamp until when the drone is unavailable.
+        """
+        self.locator.mark_unavailable(drone)
+        heapq.heappush(self._busy, (until, drone))
+
+
+def dispatch(times, locator, unavail_delta, incidents=None, policy=None):
+    """
+    For all incidents, in the given order, selects the drone to send among the available ones, by
+    default the closest one.
+
+    When two drones are at the exact same distance, the one listed first among starting points is
+    sent.
+
+    :param times: (np.array) datetimes when incidents started.
+    :param locator: an object finding the closest available drone to an incident, e.g.
+        ClosestInMatrix or spatial.ClosestInBallTree.
+    :param unavail_delta: (float) delay during which a drone is unavailable after being sent to an
+        incident in hours.
+    :param incidents: (np.array) indices of the incidents to handle, in order. By default all
+        incidents are handled. This allows to reuse the same locator for several subsets of
+        incidents.
+
+    :param policy: the policy choosing the drone to send, see policies.create. It may decline to
+        send any, see DECLINED.
+
+    :return: (np.array, np.array) distance in km covered by the drone sent to each handled incident
+        and index of this drone, respectively NaN and -1 if no drone could be sent, or NaN and
+        DECLINED if the policy sent none.
+    """
+    times = as_timestamps(times)
+    delta = hours_to_timedelta(unavail_delta)
+    if incidents is None:
+        incidents = np.arange(len(times))
+
+    fleet = Fleet(locator)
+    select = locator.closest if policy is None else functools.partial(policy.select, locator)
+    sent = np.full(len(incidents), -1)
+    for i, (incident, time) in enumerate(zip(incidents.tolist(), times[incidents].tolist())):
+        fleet.release(time)
+        drone = select(incident)
+        sent[i] = drone
+        if drone >= 0:
+            fleet.launch(drone, time + delta)
+
+    dists = np.full(len(incidents), np.nan)
+    has_drone = sent >= 0
+    dists[has_drone] = locator.distances(incidents[has_drone], sent[has_drone])
+    return dists, sent
+
+
+def reset_points(times, unavail_delta, incidents=None):
+    """
+    Find the incidents before which all drones are available again: those that start more than
+    the unavailability delay after all the previous ones. The dispatch from such an incident on
+    does not depend on the incidents before it.
+
+    :param times: (np.array) datetimes when incidents started.
+    :param unavail_delta: (float) delay during which a drone is unavailable after being sent to an
+        incident in hours.
+    :param incidents: (np.array) indices of the incidents to handle, in order, see dispatch.
+
+    :return: (np.array) positions in the handled incidents of the reset points, starting with 0.
+    """
+    times = as_timestamps(times)
+    if incidents is not None:
+        times = times[incidents]
+    if len(times) == 0:
+        return np.zeros(0, dtype=int)
+    # Incidents may not be sorted by time: drones sent to any previous one must be back.
+    latest = np.maximum.accumulate(times)
+    gaps = times[1:] - latest[:-1] > hours_to_timedelta(unavail_delta)
+    return np.concatenate([[0], np.flatnonzero(gaps) + 1])
+
+
+def _dispatch_shard(context, incidents):
+    return dispatch(
+        context['times'], context['locator'], context['unavail_delta'], incidents=incidents,
+        policy=context['policy'])
+
+
+def dispatch_sharded(
+        times, locator, unavail_delta, incidents=None, policy=None, max_workers=None):
+    """
+    Same as dispatch, with the timeline split at reset points (see reset_points) into shards
+    dispatched in parallel worker processes. As each shard starts with all drones available, the
+    result is the same as the one of dispatch.
+
+    The fleet is not split geographically: any drone can be sent to any incident as drones have
+    no maximum range, so that fleets are never disjoint.
+
+    :param max_workers: (int) number of worker processes, by default the number of CPUs. With 1,
+        or if the timeline cannot be split, incidents are dispatched in the current process.
+
+    Other parameters and the result are the ones of dispatch.
+    """
+    times = as_timestamps(times)
+    if incidents is None:
+        incidents = np.arange(len(times))
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    resets = reset_points(times, unavail_delta, incidents)
+    if max_workers == 1 or len(resets) < 2:
+        return dispatch(times, locator, unavail_delta, incidents=incidents, policy=policy)
+
+    # Cut at the reset points closest to evenly spaced positions.
+    num_shards = max_workers * _SHARDS_PER_WORKER
+    targets = np.arange(1, num_shards) * len(incidents) / num_shards
+    cuts = np.unique(resets[np.minimum(np.searchsorted(resets, targets), len(resets) - 1)])
+    shards = np.split(incidents, cuts[cuts > 0])
+
+    # The locator and the policy are sent once to each worker process.
+    context = {
+        'times': times, 'locator': locator, 'unavail_delta': unavail_delta, 'policy': policy}
+    results = process_pool.map_with_context(
+        _dispatch_shard, shards, context, max_workers=min(max_workers, len(shards)))
+    return tuple(np.concatenate(outputs) for outputs in zip(*results))
@@ -0,0 +1,120 @@
+"""Module counting how incidents flow through the stages of a simulation, for Sankey diagrams.
+
+The outcome of each incident at each stage is an integer code, so that all the flows between two
+stages are counted at once with np.bincount, whatever the number of incidents.
+"""
+
+import numpy as np
+
+# Outcomes of the drone stage.
+DRONE_FASTER = 0
+BLS_FASTER = 1
+NO_DRONE = 2
+NO_DRONE_AVAILABLE = 3
+DECLINED = 4
+NUM_DRONE_OUTCOMES = 5
+
+
+def drone_outcomes(result):
+    """
+    Find the outcome of the drone stage for each incident.
+
+    :param result: (simulation.SimulationResult) the outcome of a simulation.
+
+    :return: (np.array) DRONE_FASTER, BLS_FASTER, NO_DRONE (no drone sent), NO_DRONE_AVAILABLE or
+        DECLINED (no drone sent by the dispatch policy although one was available) for each
+        incident.
+    """
+    return np.select(
+        [result.declined, result.drone_delay == 0, result.time_diff < 0, result.time_diff >= 0],
+        [DECLINED, NO_DRONE, DRONE_FASTER, BLS_FASTER], NO_DRONE_AVAILABLE)
+
+
+def stage_outcomes(result, with_night=True):
+    """
+    Find the outcome of each stage of the Sankey diagram for each incident.
+
+    :param result: (simulation.SimulationResult) the outcome of a simulation.
+    :param with_night: (bool) whether to include the night stage.
+
+    :return: (list, list) for each stage, the outcome codes of all incidents and the number of
+        possible outcomes. Stages are: all incidents (a single outcome), detection (1 if not
+        detected), night (1 at night), witnesses (1 if not enough) and drone (see drone_outcomes).
+    """
+    codes = [np.zeros(len(result.drone_delay), dtype=int), result.no_detection.astype(int)]
+    if with_night:
+        codes.append(result.night.astype(int))
+    codes += [result.no_witness.astype(int), drone_outcomes(result)]
+    num_outcomes = [1] + [2] * (len(codes) - 2) + [NUM_DRONE_OUTCOMES]
+    return codes, num_outcomes
+
+
+def links(stage_codes, num_outcomes):
+    """
+    Count incidents going from each outcome of a stage to each outcome of the next stage.
+
+    Nodes are numbered consecutively: the outcome o of stage s is the node
+    sum(num_outcomes[:s]) + o.
+
+    :param stage_codes: (list) for each stage, the outcome codes of all incidents.
+    :param num_outcomes: (list) for each stage, the number of possible outcomes.
+
+    :return: (np.array, np.array, np.array) source node, target node and number of incidents of
+        each link with incidents, by stage then source then target.
+    """
+    offsets = np.cumsum([0] + list(num_outcomes))
+    sources, targets, counts = [], [], []
+    for stage, (from_codes, to_codes) in enumerate(zip(stage_codes, stage_codes[1:])):
+        num_from, num_to = num_outcomes[stage], num_outcomes[stage + 1]
+        matrix = np.bincount(
+            from_codes * num_to + to_codes, minlength=num_from * num_to).reshape(num_from, num_to)
+        source, target = np.nonzero(matrix)
+        sources.append(offsets[stage] + source)
+        targets.append(offsets[stage + 1] + target)
+        counts.append(matrix[source, target])
+    return np.concatenate(sources), np.concatenate(targets), np.concatenate(counts)
+
+
+def funnel(exits, labels, colors):
+    """
+    Count incidents by the first stage where they exit the funnel, as flows of the sankey.Sankey
+    component.
+
+    :param exits: (list) masks of the incidents exiting at each stage, in order.
+    :param labels: (list) the label of each exit, plus the one of the incidents that never exit.
+    :param colors: (list) the fill color of each exit, plus the one of the incidents that never
+        exit.
+
+    :return: (list) dicts with the fill color, size (in %) and text of each flow, for the flows
+        prop of sankey.Sankey. Exits without incidents are skipped.
+    """
+    first_exit = np.full(len(exits[0]), len(exits))
+    for index in reversed(range(len(exits))):
+        first_exit[exits[index]] = index
+    counts = np.bincount(first_exit, minlength=len(exits) + 1)
+    rates = 100 * counts / max(1, len(first_exit))
+    return [
+        {'fill': color, 'size': float(rate), 'text': f'{label} ({rate:.0f}%)'}
+        for label, color, count, rate in zip(labels, colors, counts, rates) if count]
+
+
+def simulation_funnel(result, labels=None):
+    """
+    Summarize a simulation as flows of the sankey.Sankey component: incidents not detected, then
+    without enough witnesses, where drones cannot fly, where no drone is available, where the
+    dispatch policy sends none, where the BLS team is faster and finally where the drone is
+    faster.
+
+    :param result: (simulation.SimulationResult) the outcome of a simulation.
+    :param labels: (list) the labels of the 7 flows, e.g. translated, by default in English.
+
+    :return: (list) flows for the flows prop of sankey.Sankey.
+    """
+    drone = drone_outcomes(result)
+    return funnel(
+        [result.no_detection, result.no_witness, drone == NO_DRONE,
+         drone == NO_DRONE_AVAILABLE, drone == DECLINED, drone == BLS_FASTER],
+        labels or [
+            'Not detected', 'Not enough witnesses', 'Drone cannot fly', 'No drone available',
+            'No drone sent by the dispatch policy', 'BLS team faster than drone', 'Drone faster'],
+        ['red', 'blue', 'grey', 'purple', 'pink', 'orange', 'green'])
@@ -0,0 +1,34 @@
+"""Configuration of gunicorn to serve the app in production with several workers:
+
+    gunicorn --config gunicorn_config.py index:server
+
+The app is loaded and warmed up once, before the workers are forked, so that they share its
+memory. Datasets are memory-mapped from their snapshots (see snapshot.py), so that all workers
+share the same pages, and simulation results are shared by all workers through a local on-disk
+cache, in CACHE_DIR.
+"""
+
+import logging
+import multiprocessing
+import os
+import tempfile
+
+bind = f'{os.getenv("BIND_HOST", "0.0.0.0")}:{os.getenv("PORT", "8050")}'
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+# Threads of each worker: the page polls simulations running in the background.
+threads = int(os.getenv('WORKER_THREADS', '4'))
+preload_app = True
+
+_CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'drone-simulation'))
+# Read when the app is loaded, after this file.
+os.environ.setdefault('RESULT_CACHE_DIR', os.path.join(_CACHE_DIR, 'results'))
+os.environ.setdefault('STAGE_CACHE_DIR', os.path.join(_CACHE_DIR, 'stages'))
+os.environ.setdefault('DATASET_CACHE_DIR', os.path.join(_CACHE_DIR, 'datasets'))
+
+
+def when_ready(unused_server):
+    """Warm up the app, loaded by then, before forking the workers."""
+    # Imported here as it is only loaded once the configuration is read.
+    import index  # pylint: disable=import-outside-toplevel
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+    index.warm_up()
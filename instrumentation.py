@@ -0,0 +1,199 @@
+"""Module measuring the time and memory used by each stage of a computation.
+
+Each stage is logged as a JSON line on the "instrumentation" logger with its wall time, the CPU
+time of its thread and, if memory is traced (TRACE_MEMORY environment variable), the peak of
+memory allocated during the stage on top of what was already allocated before.
+
+The peak of memory is global to the process: when stages of several runs overlap, e.g. two
+simulations running in different threads, it cannot be told apart and is not reported for any of
+them. Runs are context managers, so that a run that ended no longer counts as running.
+
+To profile a single request, set the PROFILE_REQUEST environment variable to "cprofile" or
+"tracemalloc": the first run wrapped in profile_once is profiled and the result is saved in the
+PROFILE_DIR folder (the temporary folder by default). Restart the server to profile another one.
+"""
+
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+_LOGGER = logging.getLogger('instrumentation')
+
+_PROFILE_MODES = ('cprofile', 'tracemalloc')
+_PROFILE_MODE = os.getenv('PROFILE_REQUEST', '').lower()
+if _PROFILE_MODE and _PROFILE_MODE not in _PROFILE_MODES:
+    raise ValueError(
+        f'PROFILE_REQUEST should be one of {", ".join(_PROFILE_MODES)}, got "{_PROFILE_MODE}"')
+_PROFILE_DIR = os.getenv('PROFILE_DIR', tempfile.gettempdir())
+# Whether the profile of a request is still to be captured.
+_PROFILE_PENDING = {'pending': bool(_PROFILE_MODE)}
+_PROFILE_LOCK = threading.Lock()
+
+# Runs whose current stage measures memory, and those whose current stage overlapped another.
+_MEMORY_RUNS = {'running': set(), 'overlapped': set()}
+_MEMORY_LOCK = threading.Lock()
+
+if os.getenv('TRACE_MEMORY'):
+    tracemalloc.start()
+
+
+def _reset_peak_memory():
+    # Python < 3.9 cannot reset the peak alone: clearing the traces resets it as well, and then
+    # only counts blocks allocated during the stage, which is what we measure anyway.
+    # Return the memory counted at the start of the stage.
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+        current, unused_peak = tracemalloc.get_traced_memory()
+        return current
+    tracemalloc.clear_traces()
+    return 0
+
+
+class RunReport:
+    """Wall time, CPU time and peak memory of each named stage of a run.
+
+    Stages are measured either with the stage context manager, or with lap for long sequential
+    code: a lap ends the stage that started at the end of the previous one. Use the run as a
+    context manager, or close it, when it ends.
+    """
+
+    def __init__(self, name, on_stage=None):
+        """
+        :param name: (str) name of the run, e.g. the kind of request.
+        :param on_stage: (callable) called with the name of each stage when it ends, e.g. to report
+            progress. It may raise to stop the run.
+        """
+        self.name = name
+        self.run_id = uuid.uuid4().hex[:12]
+        self.stages = []
+        self.on_stage = on_stage
+        self._start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *unused_exc_info):
+        self.close()
+
+    def _start(self):
+        self._start_memory = 0
+        if tracemalloc.is_tracing():
+            with _MEMORY_LOCK:
+                running = _MEMORY_RUNS['running']
+                running.discard(self.run_id)
+                if running:
+                    # Do not reset the peak of the other runs, none of them can be measured.
+                    _MEMORY_RUNS['overlapped'].update(running | {self.run_id})
+                else:
+                    _MEMORY_RUNS['overlapped'].discard(self.run_id)
+                    self._start_memory = _reset_peak_memory()
+                running.add(self.run_id)
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.thread_time()
+
+    def lap(self, name):
+        """Record a stage that started at the end of the previous one, or with the run."""
+        record = {
+            'stage': name,
+            'wall_s': round(time.perf_counter() - self._start_wall, 6),
+            'cpu_s': round(time.thread_time() - self._start_cpu, 6),
+            'peak_mb': None,
+        }
+        if tracemalloc.is_tracing() and not self._end_memory_stage():
+            unused_current, peak = tracemalloc.get_traced_memory()
+            record['peak_mb'] = round(max(0, peak - self._start_memory) / 2 ** 20, 3)
+        self.stages.append(record)
+        _LOGGER.info(json.dumps(dict(run=self.name, run_id=self.run_id, **record)))
+        if self.on_stage:
+            self.on_stage(name)
+        self._start()
+
+    def _end_memory_stage(self):
+        # Return whether the stage overlapped a stage of another run.
+        with _MEMORY_LOCK:
+            _MEMORY_RUNS['running'].discard(self.run_id)
+            overlapped = self.run_id in _MEMORY_RUNS['overlapped']
+            _MEMORY_RUNS['overlapped'].discard(self.run_id)
+        return overlapped
+
+    def close(self):
+        """End the run: the stage started by the last lap is not recorded."""
+        self._end_memory_stage()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure a stage of the run, to use as a context manager."""
+        self._start()
+        try:
+            yield
+        finally:
+            self.lap(name)
+
+    def format(self):
+        """Format the report as a plain text table, e.g. for a debug panel."""
+        lines = [f'{self.name} {self.run_id}', f'{"stage":<12}{"wall (s)":>10}{"cpu (s)":>10}'
+                 f'{"peak (MB)":>11}']
+        for record in self.stages:
+            peak = '' if record['peak_mb'] is None else f'{record["peak_mb"]:.1f}'
+            lines.append(
+                f'{record["stage"]:<12}{record["wall_s"]:>10.3f}{record["cpu_s"]:>10.3f}'
+                f'{peak:>11}')
+        return '\n'.join(lines)
+
+
+def stage(report, name):
+    """Measure a stage of a run if there is a report, see RunReport.stage."""
+    if report is None:
+        return contextlib.nullcontext()
+    return report.stage(name)
+
+
+def lap(report, name):
+    """Record a stage of a run if there is a report, see RunReport.lap."""
+    if report is not None:
+        report.lap(name)
+
+
+@contextlib.contextmanager
+def profile_once(name):
+    """
+    Profile the wrapped code the first time only, if requested by PROFILE_REQUEST.
+
+    :param name: (str) name of the run, used in the name of the profile file.
+    """
+    with _PROFILE_LOCK:
+        mode = _PROFILE_MODE if _PROFILE_PENDING['pending'] else None
+        _PROFILE_PENDING['pending'] = False
+    if not mode:
+        yield
+        return
+
+    path = os.path.join(_PROFILE_DIR, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}')
+    if mode == 'cprofile':
+        path += '.prof'
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    else:
+        path += '.tracemalloc'
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(25)
+        try:
+            yield
+        finally:
+            tracemalloc.take_snapshot().dump(path)
+            if not was_tracing:
+                tracemalloc.stop()
+    _LOGGER.info(json.dumps({'run': name, 'profile': mode, 'path': path}))
@@ -0,0 +1,132 @@
+"""Module running long computations as background jobs, shared by all users.
+
+Jobs are identified by a key, e.g. the hash of their parameters, so that the same computation
+requested twice runs once. Each client watches one job per channel (e.g. a tab of a browser
+page): when it requests another one, the job it watched before is cancelled if no other client
+watches it anymore.
+
+Jobs are tracked in the current process only: with several server processes, a client may ask
+another process for its next job, and its previous job then runs until the client asks the process
+running it again, or forgets it after channel_ttl.
+"""
+
+import concurrent.futures
+import threading
+import time
+
+
+class Cancelled(Exception):
+    """Raised inside a job when it has been cancelled."""
+
+
+class Job:
+    """A computation running in the background, reporting its progress by stage."""
+
+    def __init__(self, key, stages):
+        """
+        :param key: (str) the key of the job.
+        :param stages: (tuple) names of the stages of the job, in order, to compute its progress.
+        """
+        self.key = key
+        self.stages = stages
+        self.done_stages = []
+        self.future = None
+        self._cancelled = threading.Event()
+
+    def report_stage(self, name):
+        """Record that a stage is done, and stop the job if it has been cancelled since."""
+        if self._cancelled.is_set():
+            raise Cancelled(self.key)
+        self.done_stages.append(name)
+
+    def cancel(self):
+        """Cancel the job: it stops at the end of its current stage."""
+        self._cancelled.set()
+        if self.future:
+            self.future.cancel()
+
+    @property
+    def progress(self):
+        """Rate of the stages that are done ([0,1])."""
+        if not self.stages:
+            return 0
+        return min(1, len(self.done_stages) / len(self.stages))
+
+    @property
+    def current_stage(self):
+        """The name of the stage that is running, None if it is unknown."""
+        done = set(self.done_stages)
+        return next((stage for stage in self.stages if stage not in done), None)
+
+
+def _failed(job):
+    # Whether a job ended without a result, e.g. it raised or was cancelled.
+    future = job.future
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+
+class JobManager:
+    """A pool of worker threads running jobs, deduplicated by key."""
+
+    def __init__(self, max_workers, channel_ttl=300):
+        """
+        :param max_workers: (int) number of jobs running at the same time.
+        :param channel_ttl: (float) delay in seconds after which a channel that did not ask for its
+            job is forgotten, and its job cancelled if nobody else watches it.
+        """
+        self.channel_ttl = channel_ttl
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        # The key of the job watched by each channel, and when it was last asked for.
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def submit(self, channel, key, function, stages=()):
+        """
+        Get the job for a key, starting it if needed: a job that failed is started again.
+
+        :param channel: (str) the channel asking for the job, e.g. a tab in a browser page.
+        :param key: (str) the key of the job, e.g. the hash of its parameters.
+        :param function: (callable) the computation, called with the Job as only argument: it
+            should call Job.report_stage at the end of each stage.
+        :param stages: (tuple) names of the stages of the job, in order.
+
+        :return: (Job) the job, its future gives its result.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or _failed(job):
+                job = Job(key, stages)
+                job.future = self._executor.submit(function, job)
+                self._jobs[key] = job
+            self._watch(channel, key)
+        return job
+
+    def watch(self, channel, key):
+        """
+        Record that a channel now watches a key without starting a job, e.g. as it runs in another
+        process: the job the channel watched before is cancelled if nobody else watches it.
+
+        :param channel: (str) the channel, see submit.
+        :param key: (str) the key it watches.
+        """
+        with self._lock:
+            self._watch(channel, key)
+
+    def __contains__(self, key):
+        """Whether there is a job for a key in this process, running or done."""
+        with self._lock:
+            return key in self._jobs
+
+    def _watch(self, channel, key):
+        now = time.monotonic()
+        self._channels[channel] = (key, now)
+        for other_channel, (unused_key, last_seen) in list(self._channels.items()):
+            if now - last_seen > self.channel_ttl:
+                del self._channels[other_channel]
+
+        watched = {watched_key for watched_key, unused_last_seen in self._channels.values()}
+        for other_key in list(self._jobs):
+            if other_key not in watched:
+                self._jobs.pop(other_key).cancel()
@@ -0,0 +1,52 @@
+"""Module modeling the flight of a drone from its starting point to an incident."""
+
+import numpy as np
+
+# Names of the simulation parameters of the flight of drones, in the order of the arguments of
+# flight_time after the distance.
+FLIGHT_PARAMS = (
+    'input_speed', 'input_acc', 'vert_acc', 'alt', 'dep_delay', 'arr_delay', 'detec_delay')
+
+
+def flight_time(dist, speed, acc_time, vert_speed, alt, dep_delay, arr_delay, detec_delay):
+    """
+    Compute the time for a drone to reach incidents, from the detection of unconsciousness.
+
+    The drone takes off vertically up to its cruise altitude, accelerates up to its maximum speed,
+    flies straight, brakes and lands vertically. If the distance is too short to reach the maximum
+    speed, the drone accelerates on half the distance and brakes on the other half.
+
+    All parameters are numbers or np.array and are broadcast together, so that the same function
+    evaluates an array of distances for a single set of parameters, or for a batch of parameter
+    sets, e.g. with dist of shape (n,) and speed of shape (p, 1) the result has shape (p, n).
+
+    :param dist: distance between the drone starting point and the incident in km.
+    :param speed: drone horizontal speed in km/h.
+    :param acc_time: time needed for the drone to reach its horizontal speed in seconds.
+    :param vert_speed: drone vertical speed in m/s.
+    :param alt: flight altitude in meters.
+    :param dep_delay: departure delay in seconds.
+    :param arr_delay: arrival delay in seconds.
+    :param detec_delay: delay between detection of unconsciousness and OHCA detection by 18/112
+        operators in seconds.
+
+    :return: (np.array) time to arrival of the drone in seconds, rounded to the second, NaN where
+        the distance is NaN.
+    """
+    dist = np.asarray(dist, dtype=float)
+    climb_time = np.divide(alt, vert_speed)
+    dep_delay = np.add(dep_delay, detec_delay) + climb_time
+    arr_delay = np.add(arr_delay, climb_time)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # distance covered during acceleration and brake
+        acc_dist = 2 * np.multiply(speed, acc_time) / 3600
+        acc = np.divide(speed, np.multiply(acc_time, 3600))
+
+        lin_time = (dist / speed) * 3600
+        res_time = np.where(
+            dist - acc_dist >= 0,
+            lin_time + dep_delay + arr_delay + 2 * np.asarray(acc_time),
+            dep_delay + arr_delay + 2 * np.sqrt(dist / acc))
+
+    return np.round(res_time)
@@ -1,5 +1,8 @@
+import functools
 import gettext
+import os
 import textwrap
+import uuid
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
@@ -8,6 +11,9 @@ import drones
 
 _POSITIONS = list(drones.STARTING_POINTS.keys())
 
+# Whether to show the time and memory used by each stage of a simulation below its results.
+_DEBUG_PANEL = bool(os.getenv('DEBUG_PANEL'))
+
 
 def create_tabs_layout(simu_desc_file):
     # return dbc.Container(id='app-control-tabs', className='control-tabs', children=[
@@ -145,7 +151,9 @@ def create_tabs_layout(simu_desc_file):
                     'following fields:'
                 )]),
                 html.Ul([
-                    html.Li(_('time_call: the date and time of the emergency call')),
+                    html.Li(_(
+                        'time_call: the date and time of the emergency call, as DD/MM/YY HH:MM',
+                    )),
                     html.Li(_('latitude: the latitude of the incident, as a float')),
                     html.Li(_('longitude: the longitude of the incident as a float')),
                     html.Li(_(
@@ -297,7 +305,30 @@ def create_parameters_layout(name, suffix='', input_drone=_POSITIONS[0]):
                                  {'label': ' ' + _('No'), 'value': 'Non'}],
                         value='Non',
                         labelStyle={'display': 'inline-block', 'marginRight': '1em'})
-                ], row=True)
+                ], row=True),
+
+                dbc.FormGroup([
+                    dbc.Label(_('Dispatch policy'), id='policy_e', width=6),
+                    dbc.Tooltip(
+                        _('Which available drone is sent to an OHCA'),
+                        target='policy_e',
+                        placement='top'),
+                    dcc.Dropdown(
+                        id=f'dispatch_policy{suffix}',
+                        # Names of policies.POLICIES.
+                        options=[
+                            {'label': _('Closest drone'), 'value': 'closest'},
+                            {'label': _('Keep a drone in reserve in each sector'),
+                             'value': 'sector_reserve'},
+                            {'label': _('Spare the drones of hot zones'),
+                             'value': 'spare_hot_zones'},
+                            {'label': _('Only if the drone is predicted faster'),
+                             'value': 'only_if_faster'},
+                        ],
+                        value='closest',
+                        clearable=False,
+                        style={'width': '250px'}
+                    )], row=True)
             ]),
 
             dbc.Col(children=[
@@ -400,7 +431,13 @@ def create_parameters_layout(name, suffix='', input_drone=_POSITIONS[0]):
             id=f'seq_start{suffix}', n_clicks=0,
             children=_('Update simulation'), block='center',
             style={'flex': 1, 'marginTop': '20px', 'marginBottom': '20px'}
-        )], style={'marginTop': '20px', 'paddingRight': '0', 'paddingLeft': '0'}), \
+        ),
+        # Progress of the simulation running in the background, see callbacks._poll_drone_time.
+        html.Div(id=f'job-status{suffix}'),
+        dcc.Interval(id=f'job-poll{suffix}', interval=500, disabled=True),
+        # Hash and figures of the last simulation, shown in the graphs by callbacks._SHOW_FIGURES.
+        dcc.Store(id=f'simulation{suffix}'),
+    ], style={'marginTop': '20px', 'paddingRight': '0', 'paddingLeft': '0'}), \
         dbc.Row(children=[html.H3(_('Results')), create_graphs_layout(suffix=suffix)])
     # ], style={'marginTop': '20px', 'paddingRight': '0', 'paddingLeft': '0'})
 
@@ -433,7 +470,9 @@ def create_graphs_layout(suffix=''):
                                   html.Small(html.I(_('Hover over the graph to get more info'))),
                                   dcc.Graph(id=f'indicator-graphic4{suffix}', className='row')],
                         style={'marginTop': '20px', 'flex': 1})],
-                    style={'marginTop': '20px', 'paddingRight': '20px', 'paddingLeft': '20px'})],
+                    style={'marginTop': '20px', 'paddingRight': '20px', 'paddingLeft': '20px'}),
+            html.Pre(id=f'debug-panel{suffix}',
+                     style=None if _DEBUG_PANEL else {'display': 'none'})],
         style={'paddingRight': '20px', 'paddingLeft': '20px'})])
 
 
@@ -499,18 +538,30 @@ def create_title():
     )
 
 
-def create(lang):
+@functools.lru_cache(maxsize=None)
+def _create_content(lang):
+    # The page is the same for all visitors with the same language, except for its session id.
     desc_file = '../../assets/tab-layout3en.png'
     if lang == 'fr':
         desc_file = '../../assets/tab-layout3fr.png'
-    lang = gettext.translation('messages', localedir='locales', languages=[lang], fallback=True)
-    lang.install()
+    return [
+        create_title(),
+        dbc.Col(
+            id='vp-control-tabs', className='control-tabs',
+            children=[create_tabs_layout(desc_file)],
+            style={'marginTop': '20px', 'paddingRight': '0', 'paddingLeft': '0'})
+    ]
+
+
+def create(lang):
+    translation = gettext.translation(
+        'messages', localedir='locales', languages=[lang], fallback=True)
+    translation.install()
     return dbc.Col(
         children=[
-            create_title(),
-            dbc.Col(
-                id='vp-control-tabs', className='control-tabs',
-                children=[create_tabs_layout(desc_file)],
-                style={'marginTop': '20px', 'paddingRight': '0', 'paddingLeft': '0'})
-        ],
+            # Digest of the uploaded incidents dataset, see callbacks.custom_incidents.
+            dcc.Store(id='incidents-digest'),
+            # Identifies the page, to cancel its simulations when they are not needed anymore.
+            dcc.Store(id='session-id', data=uuid.uuid4().hex),
+        ] + _create_content(lang),
         style={'paddingTop': '20px', 'paddingLeft': '20px'})
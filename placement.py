@@ -0,0 +1,196 @@
+"""Choose where to place drones among candidate sites, to maximize the share of incidents where a
+drone is faster than the BLS team.
+
+The closest drone to an incident is assumed to be available: the share of incidents where a drone
+is faster then only depends on the chosen sites. This is a maximum coverage problem, solved on a
+matrix of which candidates beat the BLS team on which incidents, computed once. Sites are chosen
+greedily, then a chosen site is swapped for another candidate as long as this covers more
+incidents. With --simulate, each placement is also evaluated by a full simulation, where drones
+stay unavailable after a flight.
+
+Candidates are a CSV file of starting points (name, latitude, longitude), like the uploaded ones.
+
+Usage:
+
+    python placement.py candidates.csv --drones 1 50 --output placement.csv
+"""
+
+import argparse
+import dataclasses
+import json
+
+import numpy as np
+import pandas as pd
+
+import datasets
+import distances
+import kinematics
+import simulation
+
+
+def coverage_matrix(incidents, candidates, params, distance_method='geodesic'):
+    """
+    Find which candidate sites would send a drone faster than the BLS team to which incidents.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param candidates: (np.array) candidate sites (name, latitude, longitude).
+    :param params: (simulation.SimulationParams) parameters of the simulation.
+    :param distance_method: (str) method used to compute distances, see
+        distances.distance_matrix.
+
+    :return: (np.array) a boolean matrix of shape (number of incidents where a drone is sent,
+        number of candidates). Incidents that no candidate covers are left out.
+    """
+    unused_night, no_flight = simulation.flight_restrictions(incidents, params.input_jour)
+    no_detection, no_witness = simulation.draw_selection(
+        incidents, simulation.new_random_state(params.seed, params.common_random_numbers),
+        params.detec_rate_home, params.no_witness_rate, params.detec_rate_vp)
+    sent = ~(no_flight | no_detection | no_witness)
+
+    candidates = np.atleast_2d(candidates)
+    dists = distances.distance_matrix(
+        incidents.latitude[sent], incidents.longitude[sent],
+        pd.to_numeric(candidates[:, 1], errors='coerce'),
+        pd.to_numeric(candidates[:, 2], errors='coerce'), method=distance_method)
+    drone_delay = kinematics.flight_time(
+        dists, params.input_speed, params.input_acc, params.vert_acc, params.alt,
+        params.dep_delay, params.arr_delay, params.detec_delay)
+    with np.errstate(invalid='ignore'):
+        covered = drone_delay < incidents.bls_time[sent, np.newaxis]
+    return covered[covered.any(axis=1)]
+
+
+def _greedy(coverage, num_sites):
+    # Add the site covering most incidents not covered yet, one at a time.
+    uncovered = np.ones(len(coverage), dtype=np.float32)
+    sites = []
+    for unused_index in range(min(num_sites, coverage.shape[1])):
+        gains = uncovered @ coverage
+        gains[sites] = -1
+        site = int(np.argmax(gains))
+        sites.append(site)
+        uncovered[coverage[:, site] > 0] = 0
+    return sites
+
+
+def _improve_by_swaps(coverage, sites):
+    # Apply the best swap of a chosen site for another candidate, until none covers more.
+    sites = list(sites)
+    num_covering = coverage[:, sites].sum(axis=1)
+    while True:
+        best_delta, best_swap = 0, None
+        for position, site in enumerate(sites):
+            only_by_site = (coverage[:, site] > 0) & (num_covering == 1)
+            uncovered = ((num_covering == 0) | only_by_site).astype(np.float32)
+            gains = uncovered @ coverage
+            gains[sites] = -1
+            candidate = int(np.argmax(gains))
+            delta = gains[candidate] - only_by_site.sum()
+            if delta > best_delta:
+                best_delta, best_swap = delta, (position, candidate)
+        if best_swap is None:
+            return sites
+        position, candidate = best_swap
+        num_covering += coverage[:, candidate] - coverage[:, sites[position]]
+        sites[position] = candidate
+
+
+def optimize(coverage, drone_counts):
+    """
+    Choose sites for several numbers of drones.
+
+    :param coverage: (np.array) which candidates cover which incidents, see coverage_matrix.
+    :param drone_counts: (list) numbers of drones to place.
+
+    :return: (dict) for each number of drones, the sorted indexes of the chosen candidates and
+        the number of incidents they cover.
+    """
+    coverage = np.asarray(coverage, dtype=np.float32)
+    greedy_sites = _greedy(coverage, max(drone_counts, default=0))
+    placements = {}
+    for num_drones in drone_counts:
+        sites = sorted(_improve_by_swaps(coverage, greedy_sites[:num_drones]))
+        placements[num_drones] = (sites, int(coverage[:, sites].any(axis=1).sum()))
+    return placements
+
+
+def place_drones(
+        incidents, candidates, drone_counts, params=None, distance_method='geodesic',
+        simulate=False):
+    """
+    Choose where to place drones among candidate sites.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param candidates: (np.array) candidate sites (name, latitude, longitude).
+    :param drone_counts: (list) numbers of drones to place.
+    :param params: (simulation.SimulationParams) parameters of the simulation, by default those of
+        the web app.
+    :param distance_method: (str) method used to compute distances, see
+        distances.distance_matrix.
+    :param simulate: (bool) whether to also evaluate each placement with a full simulation.
+
+    :return: (pd.DataFrame) one row per number of drones, with the rate (in %) of incidents where
+        a drone is faster if the closest one is always available (drone_faster), the same rate
+        from a full simulation if requested (drone_faster_simulated) and the names of the chosen
+        sites, separated by ";".
+    """
+    if params is None:
+        params = simulation.SimulationParams()
+    candidates = np.atleast_2d(candidates)
+    placements = optimize(
+        coverage_matrix(incidents, candidates, params, distance_method), drone_counts)
+    rows = []
+    for num_drones, (sites, num_covered) in placements.items():
+        row = {
+            'num_drones': num_drones,
+            'drone_faster': 100 * num_covered / max(1, len(incidents)),
+        }
+        if simulate:
+            result = simulation.run(
+                incidents, candidates[sites], params, distance_method=distance_method)
+            row['drone_faster_simulated'] = result.summary()['drone_faster']
+        row['sites'] = ';'.join(candidates[sites, 0])
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('num_drones')
+
+
+def main(string_args=None):
+    """Parse command line arguments and choose where to place drones."""
+    parser = argparse.ArgumentParser(
+        description='Choose where to place drones among candidate sites.')
+    parser.add_argument(
+        'candidates', help='CSV file of candidate sites (name, latitude, longitude)')
+    parser.add_argument(
+        '--drones', type=int, nargs=2, default=(1, 10), metavar=('MIN', 'MAX'),
+        help='range of numbers of drones to place')
+    parser.add_argument(
+        '--incidents', help='CSV file of incidents, by default the one of the web app')
+    parser.add_argument(
+        '--params', default='{}',
+        help='JSON object of simulation parameters, see simulation.SimulationParams')
+    parser.add_argument(
+        '--simulate', action='store_true', help='evaluate each placement with a full simulation')
+    parser.add_argument(
+        '--output', default='placement.csv', help='CSV file where to write the placements')
+    args = parser.parse_args(string_args)
+
+    if args.incidents:
+        incidents = datasets.parse_incidents(args.incidents)
+    else:
+        incidents = datasets.load_default_incidents()
+    params = json.loads(args.params)
+    param_names = {field.name for field in dataclasses.fields(simulation.SimulationParams)}
+    unknown_params = set(params) - param_names
+    if unknown_params:
+        parser.error(f'Unknown parameters: {", ".join(sorted(unknown_params))}')
+    candidates = np.genfromtxt(args.candidates, delimiter=',', dtype=str)
+
+    placements = place_drones(
+        incidents, candidates, range(args.drones[0], args.drones[1] + 1),
+        params=simulation.SimulationParams(**params), simulate=args.simulate)
+    placements.to_csv(args.output)
+    print(placements.drop(columns='sites').to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""Module choosing which available drone to send to an incident, see fleet.dispatch.
+
+A dispatch policy has a select(locator, incident) method returning the index of the drone to send,
+-1 if no drone is available or fleet.DECLINED to send none although one is. It is called by the
+dispatch engine for each incident in turn, once busy drones are released, and only reads the
+availability of drones from the locator: everything a policy needs about incidents and drones is
+precomputed as arrays when it is created.
+
+The drone with the minimum predicted time to arrival is the closest one, as all drones fly alike:
+this is the default policy, 'closest'.
+"""
+
+import numpy as np
+
+import fleet
+import kinematics
+
+
+def _closest_without(locator, incident, excluded):
+    # Closest available drone among those that are not excluded, by masking them in the locator.
+    masked = np.flatnonzero(excluded & locator.available)
+    locator.available[masked] = False
+    try:
+        return locator.closest(incident)
+    finally:
+        locator.available[masked] = True
+
+
+def _nearest_drones(locator, num_incidents):
+    # Closest drone to each incident when all drones are available, -1 if none can reach it.
+    available = locator.available.copy()
+    locator.available[:] = True
+    try:
+        return np.array([locator.closest(incident) for incident in range(num_incidents)], dtype=int)
+    finally:
+        locator.available[:] = available
+
+
+class Closest:
+    """Send the closest available drone."""
+
+    def __init__(self, unused_incidents, unused_avail_ini, unused_locator):
+        pass
+
+    @staticmethod
+    def select(locator, incident):
+        """
+        Choose the drone to send to an incident.
+
+        :param locator: the locator of available drones, see simulation.build_locator.
+        :param incident: (int) index of the incident.
+
+        :return: (int) index of the drone, -1 if none is available or fleet.DECLINED to send
+            none.
+        """
+        return locator.closest(incident)
+
+
+class SectorReserve:
+    """Keep a reserve of available drones in each sector for its own incidents.
+
+    Sectors split the drones starting points into angular sectors around their center. An incident
+    belongs to the sector of its closest starting point. The closest available drone is sent,
+    unless it would leave another sector than the one of the incident without its reserve: then
+    the closest drone of a sector above its reserve is sent, and none if there is no such drone.
+    """
+
+    def __init__(self, incidents, avail_ini, locator, num_sectors=4, reserve=1):
+        """
+        :param incidents: (simulation.IncidentTable) incidents.
+        :param avail_ini: (np.array) drones initial locations (name, latitude, longitude).
+        :param locator: the locator of available drones, see simulation.build_locator.
+        :param num_sectors: (int) number of sectors.
+        :param reserve: (int) number of drones kept available in each sector.
+        """
+        coords = np.atleast_2d(avail_ini)[:, 1:3].astype(float)
+        angles = np.arctan2(*(coords - np.nanmean(coords, axis=0)).T)
+        self._sectors = np.nan_to_num(
+            (angles + np.pi) * num_sectors / (2 * np.pi), nan=0).astype(int) % num_sectors
+        self._num_sectors = num_sectors
+        self._reserve = reserve
+        nearest = _nearest_drones(locator, len(incidents))
+        self._incident_sectors = np.where(nearest >= 0, self._sectors[nearest], -1)
+
+    def select(self, locator, incident):
+        """Choose the drone to send to an incident, see Closest.select."""
+        drone = locator.closest(incident)
+        if drone < 0 or self._sectors[drone] == self._incident_sectors[incident]:
+            return drone
+        num_available = np.bincount(
+            self._sectors[locator.available], minlength=self._num_sectors)
+        if num_available[self._sectors[drone]] > self._reserve:
+            return drone
+        # Drones of other sectors than the incident one, at their reserve.
+        at_reserve = (num_available <= self._reserve)[self._sectors] & \
+            (self._sectors != self._incident_sectors[incident])
+        spare = _closest_without(locator, incident, at_reserve)
+        return fleet.DECLINED if spare < 0 else spare
+
+
+class SpareHotZones:
+    """Keep the drones of hot zones for their own incidents.
+
+    Hot zones are the areas of the starting points closest to most incidents. The closest available
+    drone is sent, unless it is one of a hot zone and the incident is outside: then the closest
+    available drone outside hot zones is sent, and the one of the hot zone only if there is none.
+    """
+
+    def __init__(self, incidents, avail_ini, locator, hot_share=0.1):
+        """
+        :param incidents: (simulation.IncidentTable) incidents.
+        :param avail_ini: (np.array) drones initial locations (name, latitude, longitude).
+        :param locator: the locator of available drones, see simulation.build_locator.
+        :param hot_share: (float) share of the starting points in hot zones, at least one.
+        """
+        num_drones = len(np.atleast_2d(avail_ini))
+        nearest = _nearest_drones(locator, len(incidents))
+        num_incidents = np.bincount(nearest[nearest >= 0], minlength=num_drones)
+        num_hot = max(1, int(round(hot_share * num_drones)))
+        self._hot = np.zeros(num_drones, dtype=bool)
+        self._hot[np.argsort(-num_incidents, kind='stable')[:num_hot]] = True
+        self._in_hot_zone = (nearest >= 0) & self._hot[nearest]
+
+    def select(self, locator, incident):
+        """Choose the drone to send to an incident, see Closest.select."""
+        drone = locator.closest(incident)
+        if drone < 0 or not self._hot[drone] or self._in_hot_zone[incident]:
+            return drone
+        spare = _closest_without(locator, incident, self._hot)
+        return drone if spare < 0 else spare
+
+
+class OnlyIfFaster:
+    """Send the closest available drone only if it is predicted to arrive before the BLS team.
+
+    Otherwise no drone is sent, and the closest one stays available for the next incidents.
+    """
+
+    def __init__(self, incidents, unused_avail_ini, unused_locator, **flight_params):
+        """
+        :param incidents: (simulation.IncidentTable) incidents.
+        :param flight_params: parameters of the flight of drones (input_speed, input_acc,
+            vert_acc, alt, dep_delay, arr_delay and detec_delay), see kinematics.flight_time.
+        """
+        self._max_dists = _max_faster_distances(incidents.bls_time.astype(float), flight_params)
+
+    def select(self, locator, incident):
+        """Choose the drone to send to an incident, see Closest.select."""
+        drone = locator.closest(incident)
+        if drone < 0 or locator.distances([incident], [drone])[0] <= self._max_dists[incident]:
+            return drone
+        return fleet.DECLINED
+
+
+def _max_faster_distances(bls_time, flight_params):
+    # The time to arrival of a drone never decreases with the distance: find by bisection, for
+    # all incidents at once, the longest distance a drone covers before the BLS team arrives.
+    def faster(dists):
+        return kinematics.flight_time(dists, *(
+            flight_params[param] for param in kinematics.FLIGHT_PARAMS)) < bls_time
+
+    known = ~np.isnan(bls_time)
+    low = np.zeros(len(bls_time))
+    # Even without any delay, a drone flying this far is not faster.
+    high = np.where(known, flight_params['input_speed'] * bls_time / 3600, 0) + 1
+    for unused_iteration in range(64):
+        middle = (low + high) / 2
+        is_faster = faster(middle)
+        low = np.where(is_faster, middle, low)
+        high = np.where(is_faster, high, middle)
+    # -1 where a drone is never faster, infinite where the BLS team time is unknown.
+    return np.where(known, np.where(faster(low), low, -1), np.inf)
+
+
+# Dispatch policies by name, with the parameters of the simulation they depend on besides the
+# unavailability delay.
+POLICIES = {
+    'closest': (Closest, ()),
+    'sector_reserve': (SectorReserve, ()),
+    'spare_hot_zones': (SpareHotZones, ()),
+    'only_if_faster': (OnlyIfFaster, kinematics.FLIGHT_PARAMS),
+}
+
+
+def create(name, incidents, avail_ini, locator, params=None):
+    """
+    Create a dispatch policy.
+
+    :param name: (str) name of the policy, a key of POLICIES.
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param avail_ini: (np.array) drones initial locations (name, latitude, longitude).
+    :param locator: the locator of available drones for these incidents and drones, see
+        simulation.build_locator.
+    :param params: (dict) parameters of the simulation, at least those the policy depends on, see
+        POLICIES.
+
+    :return: the policy, to use with fleet.dispatch.
+    """
+    if name not in POLICIES:
+        raise ValueError(f'Unknown dispatch policy: {name}')
+    policy_class, param_names = POLICIES[name]
+    return policy_class(
+        incidents, avail_ini, locator, **{param: params[param] for param in param_names})
@@ -0,0 +1,42 @@
+"""Module running tasks in a pool of worker processes, sharing data sent once to each of them.
+
+Large data shared by all tasks, e.g. incidents, is pickled once per worker process rather than
+once per task.
+"""
+
+import concurrent.futures
+import functools
+
+# Data shared by all tasks run in the current process.
+_CONTEXT = {}
+
+
+def _init_context(context):
+    _CONTEXT.clear()
+    _CONTEXT.update(context)
+
+
+def _run_task(function, task):
+    return function(_CONTEXT, task)
+
+
+def map_with_context(function, tasks, context, max_workers=None):
+    """
+    Call a function on each task, in worker processes.
+
+    :param function: (callable) a module level function, called with the context and a task. It
+        may store in the context what it computes for the next tasks of the same process, e.g.
+        locators.
+    :param tasks: (list) tasks, each one pickled to the process running it.
+    :param context: (dict) data shared by all tasks.
+    :param max_workers: (int) number of worker processes, by default the number of CPUs. With 1,
+        tasks are run in the current process.
+
+    :return: (list) the result of each task, in order.
+    """
+    if max_workers == 1:
+        context = dict(context)
+        return [function(context, task) for task in tasks]
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_context, initargs=(context,)) as executor:
+        return list(executor.map(functools.partial(_run_task, function), tasks))
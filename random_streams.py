@@ -0,0 +1,92 @@
+"""Module drawing the random numbers of simulations, as independent streams by stage.
+
+By default, numbers are drawn in sequence from a single generator, as the web app always did: the
+draw of an incident then depends on the incidents before it. With common random numbers, the draw
+of an incident only depends on the seed, the stage and the incident itself, with a counter-based
+generator: two simulations with the same seed share the same draws for the same incidents, even
+if one of them has more incidents or in another order, so that their differences are not blurred
+by random noise.
+"""
+
+import hashlib
+
+import numpy as np
+
+# Constants of the SplitMix64 generator.
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(values):
+    # SplitMix64 finalizer: a bijection of 64 bits integers whose outputs look random.
+    values = (values ^ (values >> np.uint64(30))) * _MIX_1
+    values = (values ^ (values >> np.uint64(27))) * _MIX_2
+    return values ^ (values >> np.uint64(31))
+
+
+def _as_key(value):
+    # A 64 bits key for any integer or string, stable across processes.
+    return np.uint64(int.from_bytes(
+        hashlib.sha256(str(value).encode('utf-8')).digest()[:8], 'little'))
+
+
+def incident_ids(incidents):
+    """
+    Identify incidents by their content rather than by their position.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+
+    :return: (np.array) a 64 bits id for each incident, from its time, location and BLS team time
+        to arrival. Identical incidents have the same id.
+    """
+    ids = _mix(incidents.time_call.view(np.uint64) + _GOLDEN_GAMMA)
+    for column in (
+            incidents.latitude, incidents.longitude, incidents.bls_time.astype(np.float64)):
+        ids = _mix((ids ^ column.view(np.uint64)) + _GOLDEN_GAMMA)
+    return ids
+
+
+class SequentialStreams:
+    """Random numbers drawn in sequence from a single generator, whatever the stage."""
+
+    def __init__(self, seed):
+        """
+        :param seed: (int) seed of the generator.
+        """
+        self._random_state = np.random.RandomState(seed)  # pylint: disable=no-member
+
+    def uniform(self, incidents, unused_stage):
+        """
+        Draw a number uniformly in [0,1) for each incident.
+
+        :param incidents: (simulation.IncidentTable) incidents.
+        :param stage: (str) the stage the numbers are drawn for.
+
+        :return: (np.array) the numbers.
+        """
+        return self._random_state.rand(len(incidents))
+
+
+class CounterStreams:
+    """Random numbers derived from the seed, the stage and the incident, see incident_ids."""
+
+    def __init__(self, seed):
+        """
+        :param seed: (int) seed of the streams.
+        """
+        self._seed_key = _as_key(seed)
+
+    def uniform(self, incidents, stage):
+        """
+        Draw a number uniformly in [0,1) for each incident, always the same one for the same seed,
+        stage and incident.
+
+        :param incidents: (simulation.IncidentTable) incidents.
+        :param stage: (str) the stage the numbers are drawn for.
+
+        :return: (np.array) the numbers.
+        """
+        counters = _mix(incident_ids(incidents) ^ self._seed_key) ^ _as_key(stage)
+        # The 53 high bits make a float64 in [0,1).
+        return (_mix(counters + _GOLDEN_GAMMA) >> np.uint64(11)) * 2.0 ** -53
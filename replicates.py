@@ -0,0 +1,80 @@
+"""Module running many random replicates of a simulation to get confidence intervals.
+
+Only the random draws (OHCA detection and witnesses), the dispatch that depends on them and the
+flights are computed for each replicate, see simulation.evaluate_flights: distances between
+incidents and drones and dispatch policies are computed once and shared by all replicates run in a
+process.
+"""
+
+import numpy as np
+import pandas as pd
+
+import kinematics
+import process_pool
+import simulation
+
+
+def _run_batch(context, seeds):
+    params = context['params']
+    return [
+        dict(seed=seed, **simulation.evaluate_flights(
+            context['incidents'], context['avail_ini'], context['locator'],
+            dict(params, seed=seed), context['flights'],
+            policy_cache=context.setdefault('policy_cache', {})).iloc[0])
+        for seed in seeds]
+
+
+def run_replicates(
+        incidents, avail_ini, params, num_replicates=100, first_seed=123, batch_size=25,
+        max_workers=None):
+    """
+    Run a simulation for many random seeds.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param avail_ini: (np.array) drones initial locations (name, latitude, longitude).
+    :param params: (dict) simulation parameters, with the following keys: input_jour (bool),
+        detec_rate_home, no_witness_rate, detec_rate_vp, unavail_delta, input_speed, input_acc,
+        vert_acc, alt, dep_delay, arr_delay and detec_delay (floats). See
+        callbacks._compute_drone_time for their description. Set common_random_numbers (bool)
+        to draw each incident independently of the others, see random_streams, and
+        dispatch_policy (str) to choose another dispatch policy, see policies.POLICIES.
+    :param num_replicates: (int) number of replicates, seeds are first_seed, first_seed + 1, etc.
+        The replicate with seed 123 is the one displayed in the web app.
+    :param first_seed: (int) seed of the first replicate.
+    :param batch_size: (int) number of replicates run in a row by a worker process.
+    :param max_workers: (int) number of worker processes, by default the number of CPUs. With 1,
+        replicates are run in the current process.
+
+    :return: (pd.DataFrame) one row per replicate with its seed and the metrics of
+        simulation.summarize_outcomes.
+    """
+    context = {
+        'incidents': incidents,
+        'avail_ini': avail_ini,
+        'locator': simulation.build_locator(incidents, avail_ini),
+        'params': {'common_random_numbers': False, 'dispatch_policy': 'closest', **params},
+        'flights': pd.DataFrame([
+            {param: params[param] for param in kinematics.FLIGHT_PARAMS}]),
+    }
+    seeds = np.arange(first_seed, first_seed + num_replicates)
+    batches = [seeds[start:start + batch_size].tolist()
+               for start in range(0, num_replicates, batch_size)]
+    results = process_pool.map_with_context(_run_batch, batches, context, max_workers=max_workers)
+
+    return pd.DataFrame([row for rows in results for row in rows]).set_index('seed')
+
+
+def summarize(replicates, percentiles=(2.5, 97.5)):
+    """
+    Summarize replicates with their mean and percentile bands.
+
+    :param replicates: (pd.DataFrame) the result of run_replicates.
+    :param percentiles: (tuple) percentiles to compute for each metric.
+
+    :return: (pd.DataFrame) one row per metric, with its mean and percentiles (columns p2.5, ...)
+        across replicates.
+    """
+    summary = pd.DataFrame({'mean': replicates.mean()})
+    for percentile in percentiles:
+        summary[f'p{percentile:g}'] = replicates.quantile(percentile / 100)
+    return summary
@@ -0,0 +1,148 @@
+"""Module caching simulation results across requests, keyed by the hash of their parameters."""
+
+import collections
+import contextlib
+import fcntl
+import os
+import pickle
+import tempfile
+import threading
+
+
+class ResultCache:
+    """A process-wide LRU cache of results, with an optional on-disk tier.
+
+    Results are stored pickled: their size is known exactly to enforce the memory budget, and
+    callers get a fresh copy they are free to modify. Results evicted from memory stay on disk, if
+    a directory is set, and are reloaded from there on the next request. Processes sharing the
+    same directory, e.g. the workers of a server, share their results.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None):
+        """
+        :param max_bytes: (int) memory budget for the pickled results.
+        :param disk_dir: (str) directory where to store results on disk, None to keep them in
+            memory only.
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = collections.OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.pickle')
+
+    def _lock_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.lock')
+
+    def _store_in_memory(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._num_bytes += len(data)
+            while self._num_bytes > self.max_bytes:
+                unused_key, evicted = self._entries.popitem(last=False)
+                self._num_bytes -= len(evicted)
+
+    def _load(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as disk_file:
+                data = disk_file.read()
+        except FileNotFoundError:
+            return None
+        self._store_in_memory(key, data)
+        return data
+
+    def get(self, key):
+        """Get a cached result, or None if it is not in the cache."""
+        data = self._load(key)
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+    def put(self, key, value):
+        """Add a result in the cache."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._store_in_memory(key, data)
+        if not self.disk_dir:
+            return
+        # Write to a temporary file first so that readers never see a partial file.
+        with tempfile.NamedTemporaryFile(dir=self.disk_dir, delete=False) as disk_file:
+            disk_file.write(data)
+        os.replace(disk_file.name, self._disk_path(key))
+
+    def get_or_compute(self, key, compute):
+        """
+        Get a cached result, or compute it and add it to the cache.
+
+        :param key: (str) the key of the result, e.g. the hash of its parameters. If empty, the
+            result is computed and not cached.
+        :param compute: (callable) a function without arguments to compute the result.
+        """
+        if not key:
+            return compute()
+        value = self.get(key)
+        if value is not None:
+            return value
+        if not self.disk_dir:
+            value = compute()
+            self.put(key, value)
+            return value
+        # Lock the key across processes: other workers wait for the result rather than
+        # computing it again.
+        with self._lock_key(key):
+            value = self.get(key)
+            if value is None:
+                value = compute()
+                self.put(key, value)
+        return value
+
+    @contextlib.contextmanager
+    def _lock_key(self, key):
+        # The lock file is removed before it is released, so that lock files do not pile up:
+        # processes that were waiting on it then lock the new file at the same path instead.
+        path = self._lock_path(key)
+        while True:
+            with open(path, 'ab') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    is_current = os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path))
+                except FileNotFoundError:
+                    is_current = False
+                if is_current:
+                    try:
+                        yield
+                    finally:
+                        os.remove(path)
+                    return
+
+    def is_computing(self, key):
+        """
+        Whether a result is being computed by get_or_compute, in any process sharing the directory
+        of the cache, including the current one.
+
+        :param key: (str) the key of the result.
+        """
+        if not self.disk_dir:
+            return False
+        try:
+            with open(self._lock_path(key), 'rb') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except FileNotFoundError:
+            return False
+        except BlockingIOError:
+            return True
+        return False
@@ -0,0 +1,308 @@
+"""Rank the simulation parameters by their influence on a metric, e.g. the rate of incidents where
+a drone is faster than the BLS team, with a global sensitivity analysis.
+
+Two methods are available:
+
+- Morris screening: the mean of the absolute elementary effects of each parameter (mu_star) ranks
+  parameters and their standard deviation (sigma) shows non-linear effects or interactions. It
+  takes num_trajectories * (number of parameters + 1) runs.
+- Sobol indices, from a Saltelli design: the share of the variance of the metric due to each
+  parameter alone (first_order) and with its interactions (total). It takes
+  num_samples * (number of parameters + 2) runs.
+
+Runs are evaluated in batches: runs with the same parameters changing which drone is sent (see
+sweep.DISPATCH_PARAMS) share their dispatch and their flights are computed at once, see
+simulation.evaluate_flights. Batches are spread across a process pool. All runs share the same
+random draws (seed), so that the metric only varies with the parameters.
+
+Usage:
+
+    python sensitivity.py --method sobol --samples 512 --output sobol.csv
+"""
+
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+import datasets
+import drones
+import process_pool
+import simulation
+import sweep
+
+# Default ranges of the parameters to analyze, see callbacks._compute_drone_time for their
+# description.
+DEFAULT_BOUNDS = {
+    'detec_rate_home': (0.7, 1),
+    'detec_rate_vp': (0.5, 0.9),
+    'no_witness_rate': (0.4, 0.75),
+    'input_speed': (40, 120),
+    'unavail_delta': (1, 12),
+    'dep_delay': (0, 60),
+}
+
+# Parameters that can be analyzed: the numeric ones.
+_NUMERIC_PARAMS = tuple(
+    param for param, default in sweep.DEFAULT_PARAMS.items()
+    if isinstance(default, (int, float)) and not isinstance(default, bool))
+
+
+def _evaluate_batch(context, groups):
+    incidents = context['incidents']
+    locators = context.setdefault('locators', {})
+    policy_caches = context.setdefault('policy_caches', {})
+    results = []
+    for params, runs in groups:
+        drone_input = params['drone_input']
+        if drone_input not in locators:
+            locators[drone_input] = simulation.build_locator(
+                incidents, context['starting_points'][drone_input])
+        results.append(simulation.evaluate_flights(
+            incidents, context['starting_points'][drone_input], locators[drone_input],
+            dict(params, seed=context['seed']), runs[list(sweep.KINEMATIC_PARAMS)],
+            policy_cache=policy_caches.setdefault(drone_input, {})))
+    return results
+
+
+def evaluate(
+        incidents, samples, fixed_params=None, seed=123, starting_points=None, batch_size=20,
+        max_workers=None):
+    """
+    Run a simulation for each set of parameters, in batches.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param samples: (pd.DataFrame) one row per simulation, with a column per parameter to set.
+        Parameters are named as in sweep.DEFAULT_PARAMS.
+    :param fixed_params: (dict) values of parameters missing from the samples, shared by all
+        simulations. The others take their default value.
+    :param seed: (int) seed of the random draws, shared by all simulations. The web app uses 123.
+    :param starting_points: (dict) drones initial locations (name, latitude, longitude) by name,
+        by default drones.STARTING_POINTS.
+    :param batch_size: (int) number of dispatches run in a row by a worker process.
+    :param max_workers: (int) number of worker processes, by default the number of CPUs. With 1,
+        simulations are run in the current process.
+
+    :return: (pd.DataFrame) the samples, with the metrics of simulation.summarize_outcomes.
+    """
+    fixed_params = dict(sweep.DEFAULT_PARAMS, **(fixed_params or {}))
+    unknown_params = (set(samples.columns) | set(fixed_params)) - set(sweep.DEFAULT_PARAMS)
+    if unknown_params:
+        raise ValueError(f'Unknown parameters: {", ".join(sorted(unknown_params))}')
+    if starting_points is None:
+        starting_points = drones.STARTING_POINTS
+    runs = samples.reset_index(drop=True)
+    runs = runs.assign(**{
+        param: value for param, value in fixed_params.items() if param not in runs.columns})
+
+    # Runs sharing the other parameters only differ by the flight of drones.
+    groups = [
+        (dict(zip(sweep.DISPATCH_PARAMS, dispatch_values)), runs.loc[indexes])
+        for dispatch_values, indexes in runs.groupby(
+            list(sweep.DISPATCH_PARAMS), sort=False).groups.items()]
+    batches = [groups[start:start + batch_size] for start in range(0, len(groups), batch_size)]
+
+    results = process_pool.map_with_context(
+        _evaluate_batch, batches,
+        {'incidents': incidents, 'starting_points': starting_points, 'seed': seed},
+        max_workers=max_workers)
+
+    metrics = pd.concat([result for batch in results for result in batch]).sort_index()
+    return samples.reset_index(drop=True).join(metrics)
+
+
+def _check_bounds(bounds):
+    unknown_params = set(bounds) - set(_NUMERIC_PARAMS)
+    if unknown_params:
+        raise ValueError(f'Cannot analyze parameters: {", ".join(sorted(unknown_params))}')
+    if not bounds:
+        raise ValueError('No parameters to analyze')
+
+
+def _scale(unit_samples, bounds):
+    # Map samples of [0,1]^k to the ranges of the parameters.
+    low, high = np.array(list(bounds.values()), dtype=float).T
+    return pd.DataFrame(low + unit_samples * (high - low), columns=list(bounds))
+
+
+def morris_design(num_params, num_trajectories, num_levels=4, seed=0):
+    """
+    Generate the trajectories of a Morris screening in [0,1]^num_params: each one starts from a
+    random point of a grid, then changes one parameter at a time, in a random order.
+
+    :param num_params: (int) number of parameters.
+    :param num_trajectories: (int) number of trajectories.
+    :param num_levels: (int) number of values of each parameter on the grid, an even number.
+    :param seed: (int) seed of the design.
+
+    :return: (np.array) the points, of shape (num_trajectories, num_params + 1, num_params).
+    """
+    random_state = np.random.RandomState(seed)  # pylint: disable=no-member
+    # Points as indexes of levels, moved by half the number of levels at each step.
+    delta = num_levels // 2
+    trajectories = np.empty((num_trajectories, num_params + 1, num_params), dtype=int)
+    for trajectory in trajectories:
+        point = random_state.randint(num_levels, size=num_params)
+        trajectory[0] = point
+        for step, param in enumerate(random_state.permutation(num_params), start=1):
+            # Move up if possible, down otherwise: both stay on the grid.
+            point[param] += delta if point[param] + delta < num_levels else -delta
+            trajectory[step] = point
+    return trajectories / (num_levels - 1)
+
+
+def morris(
+        incidents, bounds=None, num_trajectories=20, num_levels=4, metric='drone_faster',
+        design_seed=0, **kwargs):
+    """
+    Screen parameters with the elementary effects method of Morris.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param bounds: (dict) the range (low, high) of each parameter to analyze, by default
+        DEFAULT_BOUNDS. Other parameters are fixed, see evaluate.
+    :param num_trajectories: (int) number of trajectories, see morris_design.
+    :param num_levels: (int) number of values of each parameter, see morris_design.
+    :param metric: (str) the metric to analyze, see simulation.summarize_outcomes.
+    :param design_seed: (int) seed of the design.
+    :param kwargs: arguments of evaluate, e.g. fixed_params, seed or max_workers.
+
+    :return: (pd.DataFrame) one row per parameter, with the mean (mu), mean of the absolute
+        values (mu_star) and standard deviation (sigma) of its elementary effects: the changes of
+        the metric for a change of the parameter by its whole range. Sorted by mu_star.
+    """
+    if bounds is None:
+        bounds = DEFAULT_BOUNDS
+    _check_bounds(bounds)
+    num_params = len(bounds)
+    design = morris_design(num_params, num_trajectories, num_levels, design_seed)
+    outputs = evaluate(
+        incidents, _scale(design.reshape(-1, num_params), bounds), **kwargs)[metric]
+    outputs = outputs.values.reshape(num_trajectories, num_params + 1)
+
+    steps = np.diff(design, axis=1)
+    params = np.abs(steps).argmax(axis=2)
+    effects = np.diff(outputs, axis=1) / steps.sum(axis=2)
+    # Elementary effects by parameter, one per trajectory.
+    effects = np.take_along_axis(effects, np.argsort(params, axis=1), axis=1)
+    return pd.DataFrame({
+        'mu': effects.mean(axis=0),
+        'mu_star': np.abs(effects).mean(axis=0),
+        'sigma': effects.std(axis=0, ddof=1) if num_trajectories > 1 else np.nan,
+    }, index=pd.Index(list(bounds), name='param')).sort_values('mu_star', ascending=False)
+
+
+def saltelli_design(num_params, num_samples, seed=0):
+    """
+    Generate the samples of a Saltelli design in [0,1]^num_params: two independent matrices A
+    and B, and for each parameter, the matrix A with the column of this parameter taken from B.
+
+    :param num_params: (int) number of parameters.
+    :param num_samples: (int) number of rows of each matrix.
+    :param seed: (int) seed of the design.
+
+    :return: (np.array) the matrices A, B and A_B for each parameter, of shape
+        (num_params + 2, num_samples, num_params).
+    """
+    random_state = np.random.RandomState(seed)  # pylint: disable=no-member
+    matrix_a, matrix_b = random_state.rand(2, num_samples, num_params)
+    design = [matrix_a, matrix_b]
+    for param in range(num_params):
+        matrix_ab = matrix_a.copy()
+        matrix_ab[:, param] = matrix_b[:, param]
+        design.append(matrix_ab)
+    return np.array(design)
+
+
+def sobol(incidents, bounds=None, num_samples=256, metric='drone_faster', design_seed=0, **kwargs):
+    """
+    Compute the Sobol indices of parameters, from a Saltelli design.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param bounds: (dict) the range (low, high) of each parameter to analyze, by default
+        DEFAULT_BOUNDS. Other parameters are fixed, see evaluate.
+    :param num_samples: (int) number of samples, see saltelli_design.
+    :param metric: (str) the metric to analyze, see simulation.summarize_outcomes.
+    :param design_seed: (int) seed of the design.
+    :param kwargs: arguments of evaluate, e.g. fixed_params, seed or max_workers.
+
+    :return: (pd.DataFrame) one row per parameter, with its first order index (Saltelli 2010)
+        and total index (Jansen 1999). Sorted by total index.
+    """
+    if bounds is None:
+        bounds = DEFAULT_BOUNDS
+    _check_bounds(bounds)
+    num_params = len(bounds)
+    design = saltelli_design(num_params, num_samples, design_seed)
+    outputs = evaluate(
+        incidents, _scale(design.reshape(-1, num_params), bounds), **kwargs)[metric]
+    outputs_a, outputs_b, *outputs_ab = outputs.values.reshape(num_params + 2, num_samples)
+    outputs_ab = np.array(outputs_ab)
+    variance = np.var(np.concatenate([outputs_a, outputs_b]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Centered to reduce the variance of the estimator: E[f(A_B) - f(A)] is 0.
+        first_order = np.mean(
+            (outputs_b - outputs_b.mean()) * (outputs_ab - outputs_a), axis=1) / variance
+        total = 0.5 * np.mean((outputs_a - outputs_ab) ** 2, axis=1) / variance
+    return pd.DataFrame(
+        {'first_order': first_order, 'total': total},
+        index=pd.Index(list(bounds), name='param')).sort_values('total', ascending=False)
+
+
+def main(string_args=None):
+    """Parse command line arguments and run a sensitivity analysis."""
+    parser = argparse.ArgumentParser(
+        description='Rank the simulation parameters by their influence on a metric.')
+    parser.add_argument('--method', choices=('morris', 'sobol'), default='morris')
+    parser.add_argument(
+        '--samples', type=int, default=None,
+        help='number of trajectories (morris, 20 by default) or samples (sobol, 256 by default)')
+    parser.add_argument(
+        '--levels', type=int, default=4, help='number of values of each parameter (morris)')
+    parser.add_argument(
+        '--bounds', default=json.dumps(DEFAULT_BOUNDS),
+        help='JSON object of the range [low, high] of each parameter to analyze')
+    parser.add_argument(
+        '--params', default='{}',
+        help='JSON object of the values of the other parameters, see sweep.DEFAULT_PARAMS')
+    parser.add_argument(
+        '--metric', default='drone_faster',
+        help='metric to analyze, see simulation.summarize_outcomes')
+    parser.add_argument(
+        '--incidents', help='CSV file of incidents, by default the one of the web app')
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='number of worker processes, by default the number of CPUs')
+    parser.add_argument(
+        '--output', default='sensitivity.csv', help='CSV file where to write the indices')
+    args = parser.parse_args(string_args)
+
+    if args.incidents:
+        incidents = datasets.parse_incidents(args.incidents)
+    else:
+        incidents = datasets.load_default_incidents()
+    bounds = {param: tuple(bound) for param, bound in json.loads(args.bounds).items()}
+    params = json.loads(args.params)
+    unknown_params = set(params) - set(sweep.DEFAULT_PARAMS)
+    if unknown_params:
+        parser.error(f'Unknown parameters: {", ".join(sorted(unknown_params))}')
+    try:
+        _check_bounds(bounds)
+    except ValueError as error:
+        parser.error(str(error))
+    # The other parameters are the same in all runs.
+    params = {param: value for param, value in params.items() if param not in bounds}
+
+    kwargs = {'metric': args.metric, 'fixed_params': params, 'max_workers': args.workers}
+    if args.method == 'morris':
+        indices = morris(
+            incidents, bounds, num_trajectories=args.samples or 20, num_levels=args.levels,
+            **kwargs)
+    else:
+        indices = sobol(incidents, bounds, num_samples=args.samples or 256, **kwargs)
+    indices.to_csv(args.output)
+    print(indices.to_string())
+
+
+if __name__ == '__main__':
+    main()
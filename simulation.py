@@ -0,0 +1,579 @@
+"""Module simulating drones sent to OHCA, independently from the web app.
+
+The simulation is split in stages so that the deterministic ones (flight restrictions, distances
+between incidents and drones) can be reused across random draws and flight parameters. With a
+cache, run only computes the stages whose own inputs changed since a previous run.
+"""
+
+import collections
+import dataclasses
+import hashlib
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import distances
+import fleet
+import instrumentation
+import kinematics
+import policies
+import random_streams
+import spatial
+
+# datetime of the beginning of the emergency call
+col_time_em_call = 'time_call'
+# in seconds, BLS team delay
+col_BLS_time = 'BLS_time'
+# indicator: 1 if the incident is during the day, 0 during the night
+col_indic_day = 'day'
+# indicator : 1 if the incident is at home, 0 otherwise
+col_indic_home = 'home'
+# Latitude WGS84
+col_lat_inter = 'latitude'
+# Longitude WGS84
+col_lon_inter = 'longitude'
+
+# indicator: 1 if wind is low enough to fly (less than 50 km/h)
+col_indic_wind = 'low_wind'
+# indicator: 1 if sight is clear enough to fly
+col_indic_sight = 'clear_sight'
+
+col_drone_delay = 'col_res'
+
+# Minimum number of drones starting points, or of incidents x drones cells, to find the closest
+# drone with a spatial index rather than with a full distance matrix: 2 ** 24 cells take 128 MB.
+_SPATIAL_INDEX_MIN_DRONES = 200
+_SPATIAL_INDEX_MIN_CELLS = 1 << 24
+
+# Quantiles of the time saved by drones, among incidents where the drone is faster.
+_TIME_SAVED_QUANTILES = (25, 50, 75)
+
+
+@dataclasses.dataclass(frozen=True)
+class SimulationParams:
+    """Parameters of a simulation, with the default values of the web app."""
+
+    # drone horizontal speed in km/h
+    input_speed: float = 80
+    # drone horizontal acceleration in m/s^2
+    input_acc: float = 5
+    # drone vertical speed in m/s
+    vert_acc: float = 9
+    # flight altitude in meters
+    alt: float = 100
+    # departure delay in seconds
+    dep_delay: float = 15
+    # arrival delay in seconds
+    arr_delay: float = 15
+    # delay between detection of unconsciousness and OHCA detection by 18/112 operators in seconds
+    detec_delay: float = 104
+    # whether drones can fly during the aeronautical night
+    input_jour: bool = False
+    # rate of OHCA at home detected by 18/112 operators ([0,1])
+    detec_rate_home: float = 0.87
+    # rate of OHCA at home, which only have one witness alone ([0,1])
+    no_witness_rate: float = 0.58
+    # rate of OHCA in the streets detected by 18/112 operators ([0,1])
+    detec_rate_vp: float = 0.71
+    # delay during which a drone is unavailable after being sent to an OHCA in hours
+    unavail_delta: float = 6
+    # seed of the random draws
+    seed: int = 123
+    # whether each incident gets the same random draws for the same seed, whatever the other
+    # incidents, e.g. to compare simulations on different datasets, see random_streams
+    common_random_numbers: bool = False
+    # policy choosing which available drone is sent, a key of policies.POLICIES
+    dispatch_policy: str = 'closest'
+
+
+@dataclasses.dataclass(frozen=True)
+class SimulationResult:
+    """Outcome of a simulation for each incident, see run."""
+
+    # mask of incidents at night when drones cannot fly then
+    night: np.ndarray
+    # mask of incidents where drones cannot fly
+    no_flight: np.ndarray
+    # mask of OHCA not detected by 18/112 operators
+    no_detection: np.ndarray
+    # mask of OHCA at home with not enough witnesses
+    no_witness: np.ndarray
+    # distance in km covered by the drone sent, NaN where no drone is sent or available
+    dists: np.ndarray
+    # mask of incidents where the dispatch policy sent no drone although one was available
+    declined: np.ndarray
+    # time to arrival of drones in seconds, see compute_drone_delay
+    drone_delay: np.ndarray
+    # time difference drone - BLS team in seconds, see compute_time_diff
+    time_diff: np.ndarray
+
+    @property
+    def no_drone(self):
+        """Mask of incidents where no drone is sent."""
+        return self.no_flight | self.no_detection | self.no_witness | self.declined
+
+    def summary(self):
+        """Main metrics of the simulation, see summarize_outcomes."""
+        return summarize_outcomes(self.drone_delay, self.time_diff)
+
+    def to_frame(self):
+        """All outcomes as a DataFrame with one row per incident."""
+        return pd.DataFrame({
+            field.name: getattr(self, field.name) for field in dataclasses.fields(self)})
+
+
+class IncidentTable:
+    """Compact columnar representation of incidents, as read by the simulation.
+
+    Each column is a numpy array with the smallest dtype that keeps the simulation results
+    unchanged: int64 timestamps in nanoseconds, float32 times, booleans for flags. Coordinates stay
+    float64 as float32 would move incidents by up to half a meter. Arrays are read-only: the
+    simulation stages never modify a table, so it can be shared by concurrent simulations without
+    any copy.
+    """
+
+    __slots__ = (
+        'time_call', 'bls_time', 'latitude', 'longitude', 'day', 'low_wind', 'clear_sight', 'home')
+
+    def __init__(
+            self, time_call, bls_time, latitude, longitude, day, low_wind, clear_sight, home):
+        """
+        :param time_call: (np.array) datetime of the beginning of the emergency call, as int64
+            timestamps in nanoseconds.
+        :param bls_time: (np.array) BLS team time to arrival in seconds.
+        :param latitude: (np.array) latitude (WGS84) of the incidents.
+        :param longitude: (np.array) longitude (WGS84) of the incidents.
+        :param day: (np.array) whether the incident is during the aeronautical day.
+        :param low_wind: (np.array) whether wind is low enough to fly (less than 50 km/h).
+        :param clear_sight: (np.array) whether sight is clear enough to fly.
+        :param home: (np.array) whether the incident is at home.
+        """
+        columns = (
+            (time_call, np.int64), (bls_time, np.float32), (latitude, np.float64),
+            (longitude, np.float64), (day, bool), (low_wind, bool), (clear_sight, bool),
+            (home, bool))
+        for name, (values, dtype) in zip(self.__slots__, columns):
+            values = np.asarray(values, dtype=dtype)
+            values.flags.writeable = False
+            setattr(self, name, values)
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __len__(self):
+        return len(self.time_call)  # pylint: disable=no-member
+
+    @property
+    def nbytes(self):
+        """Memory used by the table in bytes."""
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Concatenate tables of incidents, in order."""
+        if not tables:
+            return cls(*([] for unused_name in cls.__slots__))
+        return cls(*(
+            np.concatenate([getattr(table, name) for table in tables])
+            for name in cls.__slots__))
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Convert a DataFrame of incidents, with the fields of CSV files of incidents.
+
+        Missing flags are considered true, as the simulation always did.
+        """
+        return cls(
+            time_call=df[col_time_em_call].values.astype('datetime64[ns]').astype(np.int64),
+            bls_time=df[col_BLS_time].values,
+            latitude=df[col_lat_inter].values,
+            longitude=df[col_lon_inter].values,
+            day=df[col_indic_day].values != 0,
+            low_wind=df[col_indic_wind].values != 0,
+            clear_sight=df[col_indic_sight].values != 0,
+            home=df[col_indic_home].values != 0)
+
+
+def build_locator(incidents, avail_ini, distance_method='geodesic'):
+    """
+    Prepare the lookup of the closest available drone for all incidents.
+
+    :param incidents: (IncidentTable) incidents.
+    :param avail_ini: (np.array) drones initial locations (name, latitude, longitude).
+    :param distance_method: (str) method used to compute distances, see
+        distances.distance_matrix.
+
+    :return: a locator to use with fleet.dispatch.
+    """
+    avail_ini = np.atleast_2d(avail_ini)
+    drone_lats = pd.to_numeric(avail_ini[:, 1], errors='coerce')
+    drone_lons = pd.to_numeric(avail_ini[:, 2], errors='coerce')
+    if len(avail_ini) >= _SPATIAL_INDEX_MIN_DRONES or \
+            len(incidents) * len(avail_ini) >= _SPATIAL_INDEX_MIN_CELLS:
+        return spatial.ClosestInBallTree(
+            drone_lats, drone_lons, incidents.latitude, incidents.longitude,
+            distance_method=distance_method)
+    return fleet.ClosestInMatrix(distances.distance_matrix(
+        incidents.latitude, incidents.longitude, drone_lats, drone_lons, method=distance_method))
+
+
+def flight_restrictions(incidents, input_jour):
+    """
+    Find incidents where no drone can fly, whatever happens during the call.
+
+    :param incidents: (IncidentTable) incidents.
+    :param input_jour: (bool) whether drones can fly during the aeronautical night.
+
+    :return: (np.array, np.array) masks of incidents at night when drones cannot fly then, and of
+        incidents where drones cannot fly.
+    """
+    night = np.zeros(len(incidents), dtype=bool)
+    if not input_jour:
+        night = ~incidents.day
+    no_flight = night | ~incidents.low_wind | ~incidents.clear_sight
+    return night, no_flight
+
+
+def new_random_state(seed, common_random_numbers=False):
+    """
+    Create the source of random numbers of a simulation from a seed.
+
+    :param seed: (int) seed of the random draws.
+    :param common_random_numbers: (bool) whether each incident gets the same draws for the same
+        seed whatever the other incidents, see random_streams.CounterStreams.
+    """
+    if common_random_numbers:
+        return random_streams.CounterStreams(seed)
+    return random_streams.SequentialStreams(seed)
+
+
+def draw_selection(incidents, random_state, detec_rate_home, no_witness_rate, detec_rate_vp):
+    """
+    Draw randomly which OHCA are detected by call center operators, and which have enough
+    witnesses to catch the AED.
+
+    :param incidents: (IncidentTable) incidents.
+    :param random_state: the source of random numbers, see new_random_state.
+    :param detec_rate_home: (float) rate of OHCA at home detected by 18/112 operators ([0,1])
+    :param no_witness_rate: (float) rate of OHCA at home, which only have one witness alone ([0,1])
+    :param detec_rate_vp: (float) rate of OHCA in the streets detected by 18/112 operators ([0,1])
+
+    :return: (np.array, np.array) masks of OHCA not detected, and of OHCA at home with not enough
+        witnesses.
+    """
+    in_a_public_place = ~incidents.home
+    # detection rate of OHCA in a public place
+    no_detection = in_a_public_place & \
+        (random_state.uniform(incidents, 'detection_public') > detec_rate_vp)
+    # detection rate of OHCA in a private place (at home)
+    no_detection |= ~in_a_public_place & \
+        (random_state.uniform(incidents, 'detection_home') > detec_rate_home)
+    # rate of OHCA witnesses home alone
+    no_witness = ~in_a_public_place & \
+        (random_state.uniform(incidents, 'witness') > 1 - no_witness_rate)
+    return no_detection, no_witness
+
+
+def dispatch_drones(incidents, locator, no_drone, unavail_delta, policy=None, max_workers=1):
+    """
+    Send an available drone to each incident, by default the closest one.
+
+    :param incidents: (IncidentTable) incidents, in the order they are handled.
+    :param locator: a locator for all incidents, see build_locator.
+    :param no_drone: (np.array) mask of incidents where no drone is sent.
+    :param unavail_delta: (float) delay during which a drone is unavailable after being sent to an
+        OHCA in hours.
+    :param policy: the policy choosing the drone to send, see policies.create.
+    :param max_workers: (int) number of worker processes dispatching independent parts of the
+        timeline, see fleet.dispatch_sharded, None for the number of CPUs. The result does not
+        depend on it.
+
+    :return: (np.array, np.array) distance in km covered by the drone sent to each incident, NaN
+        where no drone is sent or no drone was available, and mask of incidents where the policy
+        declined to send a drone although one was available.
+    """
+    candidates = np.flatnonzero(~no_drone)
+    dists = np.full(len(incidents), np.nan)
+    declined = np.zeros(len(incidents), dtype=bool)
+    dists[candidates], sent = fleet.dispatch_sharded(
+        incidents.time_call, locator, unavail_delta, incidents=candidates, policy=policy,
+        max_workers=max_workers)
+    declined[candidates] = sent == fleet.DECLINED
+    return dists, declined
+
+
+def compute_drone_delay(
+        dists, no_drone, input_speed, input_acc, vert_acc, alt, dep_delay, arr_delay,
+        detec_delay):
+    """
+    Compute the time to arrival of drones.
+
+    :param dists: (np.array) distance covered by drones, see dispatch_drones.
+    :param no_drone: (np.array) mask of incidents where no drone is sent, including those declined
+        by the dispatch policy.
+
+    Other parameters are the flight parameters of kinematics.flight_time: they can be arrays of
+    shape (p, 1) to compute the time to arrival for p sets of flight parameters at once.
+
+    :return: (np.array) time to arrival of drones in seconds, 0 where no drone is sent and NaN
+        where no drone was available.
+    """
+    return np.where(no_drone, 0, kinematics.flight_time(
+        dists, input_speed, input_acc, vert_acc, alt, dep_delay, arr_delay, detec_delay))
+
+
+def compute_time_diff(incidents, drone_delay):
+    """
+    Compare the time to arrival of drones and of BLS teams.
+
+    :param incidents: (IncidentTable) incidents.
+    :param drone_delay: (np.array) time to arrival of drones, see compute_drone_delay. Its last
+        axis is the incidents one.
+
+    :return: (np.array) time difference drone - BLS team in seconds, negative when the drone is
+        faster. Where no drone is sent, this is the time to arrival of the BLS team.
+    """
+    bls_time = incidents.bls_time.astype(float)
+    return np.where(drone_delay == 0, bls_time, drone_delay - bls_time)
+
+
+def summarize_outcomes(drone_delay, time_diff):
+    """
+    Compute the main metrics of a simulation.
+
+    :param drone_delay: (np.array) time to arrival of drones, see compute_drone_delay.
+    :param time_diff: (np.array) time difference drone - BLS team, see compute_time_diff.
+
+    Both arrays can have extra leading axes, e.g. one per set of parameters: the metrics are then
+    computed along the last axis only.
+
+    :return: (dict) the rates (in %) of incidents where the drone is faster (drone_faster), the BLS
+        team is faster (bls_faster) or no drone is sent (no_drone), and the mean and quartiles of
+        the time saved in seconds when the drone is faster (time_saved_mean, time_saved_p25...).
+    """
+    valid = ~np.isnan(time_diff)
+    num_incidents = np.maximum(1, valid.sum(axis=-1))
+    drone_faster = time_diff < 0
+    no_drone = valid & (drone_delay == 0)
+    summary = {
+        'drone_faster': 100 * drone_faster.sum(axis=-1) / num_incidents,
+        'bls_faster': 100 * (valid & ~drone_faster & ~no_drone).sum(axis=-1) / num_incidents,
+        'no_drone': 100 * no_drone.sum(axis=-1) / num_incidents,
+    }
+    time_saved = np.where(drone_faster, -time_diff, np.nan)
+    with warnings.catch_warnings():
+        # Simulations where the drone is never faster have no time saved.
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        summary['time_saved_mean'] = np.nanmean(time_saved, axis=-1)
+        for quantile in _TIME_SAVED_QUANTILES:
+            summary[f'time_saved_p{quantile}'] = np.nanpercentile(time_saved, quantile, axis=-1)
+    return summary
+
+
+def evaluate_flights(incidents, avail_ini, locator, params, flights, policy_cache=None):
+    """
+    Run simulations that only differ by the flight of drones: the random draws and the dispatch
+    are shared by all of them, unless the dispatch policy depends on the flight of drones, and
+    their flights are computed at once with broadcast array operations.
+
+    :param incidents: (IncidentTable) incidents, in the order they are handled.
+    :param avail_ini: (np.array) drones initial locations (name, latitude, longitude).
+    :param locator: a locator for these incidents and drones, see build_locator.
+    :param params: (dict) the parameters shared by all simulations, named as in SimulationParams:
+        input_jour, seed, common_random_numbers, detec_rate_home, no_witness_rate, detec_rate_vp,
+        unavail_delta and dispatch_policy.
+    :param flights: (pd.DataFrame) one row per simulation, with a column per parameter of the
+        flight of drones, see kinematics.FLIGHT_PARAMS.
+    :param policy_cache: (dict) dispatch policies created for these incidents and drones, to reuse
+        them across calls, e.g. for several seeds.
+
+    :return: (pd.DataFrame) the metrics of summarize_outcomes, with the index of flights.
+    """
+    if policy_cache is None:
+        policy_cache = {}
+    unused_night, no_flight = flight_restrictions(incidents, params['input_jour'])
+    no_detection, no_witness = draw_selection(
+        incidents, new_random_state(params['seed'], params['common_random_numbers']),
+        params['detec_rate_home'], params['no_witness_rate'], params['detec_rate_vp'])
+    no_drone = no_flight | no_detection | no_witness
+
+    # Policies depending on the flight of drones need a dispatch per flight parameters.
+    policy_params = list(policies.POLICIES[params['dispatch_policy']][1])
+    summaries = []
+    for policy_values, group in (
+            flights.groupby(policy_params, sort=False) if policy_params else [((), flights)]):
+        policy_key = (params['dispatch_policy'],) + tuple(np.atleast_1d(policy_values))
+        if policy_key not in policy_cache:
+            policy_cache[policy_key] = policies.create(
+                params['dispatch_policy'], incidents, avail_ini, locator,
+                dict(zip(policy_params, np.atleast_1d(policy_values))))
+        dists, declined = dispatch_drones(
+            incidents, locator, no_drone, params['unavail_delta'],
+            policy=policy_cache[policy_key])
+
+        # One row per simulation, to broadcast against the incidents axis.
+        drone_delay = compute_drone_delay(dists, no_drone | declined, **{
+            param: group[param].values.astype(float)[:, np.newaxis]
+            for param in kinematics.FLIGHT_PARAMS})
+        time_diff = compute_time_diff(incidents, drone_delay)
+        summaries.append(
+            pd.DataFrame(summarize_outcomes(drone_delay, time_diff), index=group.index))
+    return pd.concat(summaries).reindex(flights.index)
+
+
+def _locator_stage(context):
+    return build_locator(
+        context.incidents, context.avail_ini, distance_method=context.distance_method)
+
+
+def _selection_stage(context):
+    params = context.params
+    night, no_flight = flight_restrictions(context.incidents, params.input_jour)
+    no_detection, no_witness = draw_selection(
+        context.incidents, new_random_state(params.seed, params.common_random_numbers),
+        params.detec_rate_home, params.no_witness_rate, params.detec_rate_vp)
+    return night, no_flight, no_detection, no_witness
+
+
+def _no_drone(selection):
+    unused_night, no_flight, no_detection, no_witness = selection
+    return no_flight | no_detection | no_witness
+
+
+def _dispatch_stage(context, locator, selection):
+    params = context.params
+    policy = policies.create(
+        params.dispatch_policy, context.incidents, context.avail_ini, locator,
+        dataclasses.asdict(params))
+    return dispatch_drones(
+        context.incidents, locator, _no_drone(selection), params.unavail_delta, policy=policy,
+        max_workers=context.dispatch_workers)
+
+
+def _kinematics_stage(context, selection, dispatch):
+    params = context.params
+    dists, declined = dispatch
+    drone_delay = compute_drone_delay(
+        dists, _no_drone(selection) | declined, params.input_speed, params.input_acc,
+        params.vert_acc, params.alt, params.dep_delay, params.arr_delay, params.detec_delay)
+    return drone_delay, compute_time_diff(context.incidents, drone_delay)
+
+
+# What a stage computes from the simulation context and the outputs of other stages.
+_Stage = collections.namedtuple('_Stage', ['data', 'params', 'inputs', 'compute', 'cached'])
+_StageContext = collections.namedtuple(
+    '_StageContext', ['incidents', 'avail_ini', 'distance_method', 'params', 'dispatch_workers'])
+
+# Stages of a simulation in the order they run, with the data (see stage_keys), parameters and
+# outputs of other stages they depend on. The locator is too big to be worth caching.
+_STAGES = collections.OrderedDict([
+    ('locator', _Stage(
+        data=('incidents', 'drones', 'distance_method'), params=(), inputs=(),
+        compute=_locator_stage, cached=False)),
+    ('selection', _Stage(
+        data=('incidents',),
+        params=(
+            'input_jour', 'seed', 'common_random_numbers', 'detec_rate_home', 'no_witness_rate',
+            'detec_rate_vp'),
+        inputs=(), compute=_selection_stage, cached=True)),
+    ('dispatch', _Stage(
+        data=('incidents',), params=('unavail_delta', 'dispatch_policy'),
+        inputs=('locator', 'selection'),
+        compute=_dispatch_stage, cached=True)),
+    ('kinematics', _Stage(
+        data=('incidents',), params=kinematics.FLIGHT_PARAMS,
+        inputs=('selection', 'dispatch'), compute=_kinematics_stage, cached=True)),
+])
+
+# Stages whose outputs make the result of a simulation.
+_RESULT_STAGES = ('selection', 'dispatch', 'kinematics')
+
+# Version of the format of the outputs of stages, part of their keys so that outputs cached in an
+# older format are not reused.
+_STAGES_VERSION = 2
+
+
+def stage_keys(data_keys, params):
+    """
+    Compute the key of the output of each stage of a simulation, from its own inputs only: a
+    stage keeps its key when parameters of other stages change.
+
+    :param data_keys: (dict) keys identifying the 'incidents', the 'drones' initial locations
+        and the 'distance_method', e.g. digests of their content.
+    :param params: (SimulationParams) parameters of the simulation.
+
+    :return: (dict) the key of each stage, by name.
+    """
+    keys = {}
+    for name, stage in _STAGES.items():
+        param_names = stage.params
+        if 'dispatch_policy' in param_names:
+            # Some policies also depend on other parameters, e.g. the flight of drones.
+            param_names += policies.POLICIES[params.dispatch_policy][1]
+        content = [name, _STAGES_VERSION, [data_keys[data] for data in stage.data],
+                   [getattr(params, param) for param in param_names],
+                   [keys[other] for other in stage.inputs]]
+        keys[name] = hashlib.sha256(json.dumps(content).encode('utf-8')).hexdigest()
+    return keys
+
+
+def run(
+        incidents, avail_ini, params, locator=None, distance_method='geodesic', report=None,
+        cache=None, data_keys=None, dispatch_workers=1):
+    """
+    Run a full simulation.
+
+    :param incidents: (IncidentTable) incidents, in the order they are handled.
+    :param avail_ini: (np.array) drones initial locations (name, latitude, longitude).
+    :param params: (SimulationParams) parameters of the simulation.
+    :param locator: a locator built by build_locator for these incidents and drones, to share it
+        between simulations. By default, a new one is built if needed.
+    :param distance_method: (str) method used to compute distances if a new locator is built, see
+        distances.distance_matrix.
+    :param report: (instrumentation.RunReport) where to record the time and memory used by each
+        stage, None to skip it.
+    :param cache: (result_cache.ResultCache) where to reuse the outputs of stages whose inputs did
+        not change, None to compute all stages. Only stages whose output is missing from the
+        cache, and the stages they depend on, are computed.
+    :param data_keys: (dict) keys identifying the 'incidents' and the 'drones' initial locations,
+        required with a cache, see stage_keys.
+    :param dispatch_workers: (int) number of worker processes of the dispatch, see
+        dispatch_drones.
+
+    :return: (SimulationResult) the outcome for each incident.
+    """
+    outputs = {} if locator is None else {'locator': locator}
+    keys = {}
+    if cache is not None:
+        with instrumentation.stage(report, 'lookup'):
+            keys = stage_keys(dict(data_keys, distance_method=distance_method), params)
+            for name, stage in _STAGES.items():
+                if stage.cached and name in _RESULT_STAGES:
+                    output = cache.get(keys[name])
+                    if output is not None:
+                        outputs[name] = output
+
+    # Walk back from the result to find which stages need to run.
+    needed = set(_RESULT_STAGES)
+    for name in reversed(_STAGES):
+        if name in needed and name not in outputs:
+            needed.update(_STAGES[name].inputs)
+
+    context = _StageContext(incidents, avail_ini, distance_method, params, dispatch_workers)
+    for name, stage in _STAGES.items():
+        with instrumentation.stage(report, name):
+            if name in needed and name not in outputs:
+                outputs[name] = stage.compute(
+                    context, *[outputs[other] for other in stage.inputs])
+                if keys and stage.cached:
+                    cache.put(keys[name], outputs[name])
+
+    night, no_flight, no_detection, no_witness = outputs['selection']
+    dists, declined = outputs['dispatch']
+    drone_delay, time_diff = outputs['kinematics']
+    return SimulationResult(
+        night=night, no_flight=no_flight, no_detection=no_detection, no_witness=no_witness,
+        dists=dists, declined=declined, drone_delay=drone_delay, time_diff=time_diff)
@@ -0,0 +1,125 @@
+"""Module saving arrays parsed from data files as binary snapshots, loaded without any parsing.
+
+A snapshot is a folder of .npy files, one per array, with the digest of the files it was parsed
+from: it is ignored as soon as one of them changes. The default datasets are saved in a snapshot
+the first time they are parsed, or beforehand with:
+
+    python snapshot.py
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+# Folder of the snapshots.
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join('data', 'snapshot'))
+
+_MANIFEST = 'manifest.json'
+
+
+def _sources_digest(sources):
+    digest = hashlib.sha1()
+    for source in sources:
+        with open(source, 'rb') as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()
+
+
+def write_arrays(path, arrays, **metadata):
+    """
+    Write arrays in a folder of .npy files, replacing it at once.
+
+    :param path: (str) path of the folder.
+    :param arrays: (dict) the arrays by name, they cannot hold Python objects.
+    :param metadata: values saved with the arrays, see read_arrays.
+    """
+    parent = os.path.dirname(path) or '.'
+    os.makedirs(parent, exist_ok=True)
+    # Write to a temporary folder first so that readers never see a partial folder.
+    tmp_path = tempfile.mkdtemp(dir=parent)
+    try:
+        for array_name, values in arrays.items():
+            np.save(os.path.join(tmp_path, f'{array_name}.npy'), values, allow_pickle=False)
+        with open(os.path.join(tmp_path, _MANIFEST), 'w', encoding='utf-8') as manifest_file:
+            json.dump(dict(metadata, arrays=list(arrays)), manifest_file)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def read_arrays(path, mmap_mode=None):
+    """
+    Read arrays written by write_arrays.
+
+    :param path: (str) path of the folder.
+    :param mmap_mode: (str) memory-map the arrays rather than reading them, see np.load: all
+        the processes mapping the same files share their memory.
+
+    :return: (dict, dict) the arrays by name, and the metadata saved with them.
+    """
+    with open(os.path.join(path, _MANIFEST), encoding='utf-8') as manifest_file:
+        metadata = json.load(manifest_file)
+    arrays = {
+        array_name: np.load(os.path.join(path, f'{array_name}.npy'), mmap_mode=mmap_mode)
+        for array_name in metadata.pop('arrays')}
+    return arrays, metadata
+
+
+def load(name, sources, mmap_mode=None):
+    """
+    Load the arrays of a snapshot.
+
+    :param name: (str) name of the snapshot.
+    :param sources: (list) paths of the files the arrays were parsed from.
+    :param mmap_mode: (str) memory-map the arrays rather than reading them, see read_arrays.
+
+    :return: (dict) the arrays by name, or None if there is no snapshot of the current content of
+        the sources.
+    """
+    try:
+        arrays, metadata = read_arrays(os.path.join(SNAPSHOT_DIR, name), mmap_mode=mmap_mode)
+        if metadata['sources'] != _sources_digest(sources):
+            return None
+        return arrays
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save(name, sources, arrays):
+    """
+    Save arrays in a snapshot, replacing the previous one. Failures, e.g. on a read-only file
+    system, are only logged: the sources are then parsed again on the next start.
+
+    :param name: (str) name of the snapshot.
+    :param sources: (list) paths of the files the arrays were parsed from.
+    :param arrays: (dict) the arrays by name, they cannot hold Python objects.
+    """
+    try:
+        write_arrays(
+            os.path.join(SNAPSHOT_DIR, name), arrays, sources=_sources_digest(sources))
+    except OSError:
+        _LOGGER.warning('Could not save the snapshot "%s"', name, exc_info=True)
+
+
+def main():
+    """Save the snapshots of the default datasets."""
+    # Imported here as they use this module to load the default datasets.
+    import datasets  # pylint: disable=import-outside-toplevel
+    import drones  # pylint: disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.INFO)
+    datasets.save_default_snapshot()
+    drones.save_snapshot()
+    _LOGGER.info('Snapshots saved in %s', SNAPSHOT_DIR)
+
+
+if __name__ == '__main__':
+    main()
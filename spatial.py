@@ -0,0 +1,113 @@
+"""Module finding the closest available drones with a spatial index, for large fleets."""
+
+import numpy as np
+
+import distances
+
+# Relative margin between haversine and geodesic distances: a drone farther than the closest
+# available one by more than this factor on the sphere is also farther on the ellipsoid.
+_ELLIPSOID_MARGIN = 1.02
+
+
+class ClosestInBallTree:
+    """Lookup of the closest available drone backed by a haversine BallTree.
+
+    A BallTree does not support deletions: unavailable drones are only masked. The first neighbors
+    of all incidents are fetched at once when building the lookup: when none of them is available,
+    or some drones left out might still be the closest one, all available drones are scanned.
+
+    This has the same interface as fleet.ClosestInMatrix, but never computes the full incidents x
+    drones distance matrix: use it for fleets of hundreds or thousands of starting points.
+    """
+
+    def __init__(
+            self, drone_lats, drone_lons, incident_lats, incident_lons,
+            distance_method='geodesic', num_neighbors=8):
+        """
+        :param drone_lats: (np.array) latitudes (WGS84) of the drones starting points.
+        :param drone_lons: (np.array) longitudes (WGS84) of the drones starting points.
+        :param incident_lats: (np.array) latitudes (WGS84) of the incidents.
+        :param incident_lons: (np.array) longitudes (WGS84) of the incidents.
+        :param distance_method: (str) method used to compute distances, see
+            distances.distance_matrix.
+        :param num_neighbors: (int) number of neighbors fetched at first for each incident.
+        """
+        self._drone_coords = _as_radians(drone_lats, drone_lons)
+        self._incident_coords = _as_radians(incident_lats, incident_lons)
+        self._distance_method = distance_method
+        self.available = np.ones(len(self._drone_coords), dtype=bool)
+
+        self._valid_drones = np.flatnonzero(np.isfinite(self._drone_coords).all(axis=1))
+        valid_incidents = np.isfinite(self._incident_coords).all(axis=1)
+        self._num_neighbors = min(num_neighbors, len(self._valid_drones))
+        if not self._num_neighbors:
+            self._tree = None
+            return
+        # scikit-learn takes most of the startup time of the app, and is only needed for large
+        # fleets.
+        from sklearn import neighbors  # pylint: disable=import-outside-toplevel
+        self._tree = neighbors.BallTree(
+            self._drone_coords[self._valid_drones], metric='haversine')
+        self._first_dists = np.full((len(self._incident_coords), self._num_neighbors), np.nan)
+        self._first_neighbors = np.full(self._first_dists.shape, -1)
+        if valid_incidents.any():
+            self._first_dists[valid_incidents], self._first_neighbors[valid_incidents] = \
+                self._tree.query(self._incident_coords[valid_incidents], k=self._num_neighbors)
+
+    def mark_available(self, drone):
+        self.available[drone] = True
+
+    def mark_unavailable(self, drone):
+        self.available[drone] = False
+
+    def _angles(self, incident, drones):
+        # Haversine distances in radians between an incident and drones, as in the BallTree.
+        phi_a, lambda_a = self._incident_coords[incident]
+        phi_b, lambda_b = self._drone_coords[drones].T
+        hav = np.sin((phi_b - phi_a) / 2) ** 2 + \
+            np.cos(phi_a) * np.cos(phi_b) * np.sin((lambda_b - lambda_a) / 2) ** 2
+        return 2 * np.arcsin(np.sqrt(np.clip(hav, 0, 1)))
+
+    def closest(self, incident):
+        """
+        Find the closest available drone to an incident.
+
+        :param incident: (int) index of the incident.
+
+        :return: (int) index of the drone, -1 if no drone is available.
+        """
+        if self._tree is None or self._first_neighbors[incident, 0] < 0:
+            return -1
+        dists, drones = self._first_dists[incident], self._valid_drones[
+            self._first_neighbors[incident]]
+        available = self.available[drones]
+        all_fetched = self._num_neighbors == len(self._valid_drones)
+        max_dist = dists[available][0] * _ELLIPSOID_MARGIN if available.any() else np.nan
+        # Make sure that all drones that might be the closest one have been fetched.
+        if not (all_fetched or dists[-1] > max_dist):
+            drones = self._valid_drones[self.available[self._valid_drones]]
+            dists = self._angles(incident, drones)
+            max_dist = dists.min(initial=np.inf) * _ELLIPSOID_MARGIN
+            available = np.ones(len(drones), dtype=bool)
+
+        candidates = np.sort(drones[available & (dists <= max_dist)])
+        if len(candidates) == 0:
+            return -1
+        if len(candidates) == 1:
+            return candidates[0]
+        return candidates[np.argmin(self.distances(np.full(len(candidates), incident), candidates))]
+
+    def distances(self, incidents, drones):
+        """Distances in km between pairs of incidents and drones, given by their indices."""
+        incident_coords = np.degrees(self._incident_coords[incidents])
+        drone_coords = np.degrees(self._drone_coords[drones])
+        return distances.paired_distances(
+            incident_coords[:, 0], incident_coords[:, 1], drone_coords[:, 0], drone_coords[:, 1],
+            method=self._distance_method)
+
+
+def _as_radians(lats, lons):
+    coords = np.radians(np.column_stack([
+        np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)]))
+    coords[np.abs(coords[:, 0]) > np.pi / 2] = np.nan
+    return coords
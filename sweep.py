@@ -0,0 +1,77 @@
+"""Module evaluating a simulation on a grid of parameters.
+
+Parameters that only change the flight of drones are evaluated for all their combinations at once,
+see simulation.evaluate_flights. Only parameters that change which drone is sent to which incident
+trigger a new dispatch.
+"""
+
+import dataclasses
+import itertools
+
+import pandas as pd
+
+import drones
+import kinematics
+import simulation
+
+# Parameters that only change the flight of a drone, see kinematics.flight_time.
+KINEMATIC_PARAMS = kinematics.FLIGHT_PARAMS
+# Parameters that change which drones are sent.
+DISPATCH_PARAMS = (
+    'drone_input', 'input_jour', 'unavail_delta', 'detec_rate_home', 'no_witness_rate',
+    'detec_rate_vp', 'common_random_numbers', 'dispatch_policy')
+
+# Default values of the web app: those of simulation.SimulationParams, except the seed which is
+# shared by all combinations.
+DEFAULT_PARAMS = dict(drone_input='Postes de commandement', **{
+    field.name: field.default for field in dataclasses.fields(simulation.SimulationParams)
+    if field.name != 'seed'})
+
+
+def sweep(incidents, grid, seed=123, starting_points=None):
+    """
+    Run a simulation for all combinations of a grid of parameters.
+
+    :param incidents: (simulation.IncidentTable) incidents.
+    :param grid: (dict) for each parameter to vary, the list of its values. Parameters are named
+        as in DEFAULT_PARAMS, see callbacks._compute_drone_time for their description. Numbers are
+        floats, input_jour is a bool, drone_input is a key of starting_points and dispatch_policy a
+        key of policies.POLICIES. Parameters missing from the grid take their default value.
+    :param seed: (int) seed of the random draws, shared by all combinations. The web app uses 123.
+    :param starting_points: (dict) drones initial locations (name, latitude, longitude) by name,
+        by default drones.STARTING_POINTS.
+
+    :return: (pd.DataFrame) one row per combination of parameters with their values and the
+        metrics of simulation.summarize_outcomes.
+    """
+    unknown_params = set(grid) - set(DEFAULT_PARAMS)
+    if unknown_params:
+        raise ValueError(f'Unknown parameters: {", ".join(sorted(unknown_params))}')
+    if starting_points is None:
+        starting_points = drones.STARTING_POINTS
+    values = {
+        param: list(grid[param]) if param in grid else [default]
+        for param, default in DEFAULT_PARAMS.items()
+    }
+
+    kinematic_combinations = pd.DataFrame(
+        list(itertools.product(*(values[param] for param in KINEMATIC_PARAMS))),
+        columns=KINEMATIC_PARAMS)
+
+    locators = {}
+    policy_caches = {}
+    results = []
+    for dispatch_values in itertools.product(*(values[param] for param in DISPATCH_PARAMS)):
+        params = dict(zip(DISPATCH_PARAMS, dispatch_values))
+        drone_input = params['drone_input']
+        if drone_input not in locators:
+            locators[drone_input] = simulation.build_locator(
+                incidents, starting_points[drone_input])
+        metrics = simulation.evaluate_flights(
+            incidents, starting_points[drone_input], locators[drone_input],
+            dict(params, seed=seed), kinematic_combinations,
+            policy_cache=policy_caches.setdefault(drone_input, {}))
+        results.append(kinematic_combinations.assign(**params).join(metrics))
+
+    return pd.concat(results, ignore_index=True)[
+        list(DEFAULT_PARAMS) + [col for col in results[0].columns if col not in DEFAULT_PARAMS]]
@@ -0,0 +1,96 @@
+"""Module generating synthetic incidents and drones bases around Paris, e.g. for benchmarks.
+
+Incidents have the same fields as the dataset gathered in 2017 by Paris' Firefighters, with rates
+close to the real ones, but their locations and times are drawn independently.
+"""
+
+import numpy as np
+import pandas as pd
+
+import datasets
+import simulation
+
+# Center and spread in degrees of the incidents, close to those of the 2017 dataset.
+_PARIS_LAT = 48.8564
+_PARIS_LON = 2.3753
+_SPREAD_LAT = 0.045
+_SPREAD_LON = 0.07
+
+# Fields of the CSV files of incidents, in order.
+_CSV_COLUMNS = [
+    simulation.col_time_em_call, simulation.col_BLS_time, simulation.col_indic_day,
+    simulation.col_indic_wind, simulation.col_indic_sight, 'vent moyen', 'direction vent',
+    'Distance_CSPP', 'Distance_PCPP', simulation.col_indic_home, 'Lieu public', 'Voie publique',
+    simulation.col_lat_inter, simulation.col_lon_inter]
+
+
+def _random_state(seed):
+    return np.random.RandomState(seed)  # pylint: disable=no-member
+
+
+def generate_incidents(num_incidents, seed=0, year=2017):
+    """
+    Generate random incidents around Paris.
+
+    :param num_incidents: (int) number of incidents.
+    :param seed: (int) seed of the random draws.
+    :param year: (int) year during which incidents happen.
+
+    :return: (pd.DataFrame) incidents sorted by time, with the fields of the CSV files of
+        incidents (see the Custom Datasets tab) and time_call as datetimes.
+    """
+    random_state = _random_state(seed)
+    start = np.datetime64(f'{year}-01-01', 'm')
+    num_minutes = (np.datetime64(f'{year + 1}-01-01', 'm') - start).astype(int)
+    time_call = start + np.sort(random_state.randint(0, num_minutes, num_incidents))
+    hours = (time_call - time_call.astype('datetime64[D]')).astype(int) // 60
+
+    # BLS teams mostly arrive in 5 to 10 minutes, never after 25 minutes.
+    bls_time = np.minimum(np.round(random_state.gamma(6, 75, num_incidents)), 25 * 60)
+    place = random_state.choice(3, size=num_incidents, p=[.77, .13, .10])
+    wind = np.round(random_state.gamma(4, 3, num_incidents), 2)
+    return pd.DataFrame({
+        simulation.col_time_em_call: time_call.astype('datetime64[ns]'),
+        simulation.col_BLS_time: bls_time,
+        simulation.col_indic_day: ((hours >= 7) & (hours < 19)).astype(int),
+        simulation.col_indic_wind: (wind < 50).astype(int),
+        simulation.col_indic_sight: (random_state.rand(num_incidents) < .97).astype(int),
+        'vent moyen': wind,
+        'direction vent': 10 * random_state.randint(0, 37, num_incidents).astype(float),
+        # Only used for the display of the 2017 dataset, not by the simulation.
+        'Distance_CSPP': np.nan,
+        'Distance_PCPP': np.nan,
+        simulation.col_indic_home: (place == 0).astype(int),
+        'Lieu public': (place == 1).astype(int),
+        'Voie publique': (place == 2).astype(int),
+        simulation.col_lat_inter: random_state.normal(_PARIS_LAT, _SPREAD_LAT, num_incidents),
+        simulation.col_lon_inter: random_state.normal(_PARIS_LON, _SPREAD_LON, num_incidents),
+    }, columns=_CSV_COLUMNS)
+
+
+def write_incidents_csv(incidents, path):
+    """
+    Write incidents in the format of the CSV files of incidents, see datasets.parse_incidents.
+
+    :param incidents: (pd.DataFrame) incidents, see generate_incidents.
+    :param path: (str) path of the CSV file.
+    """
+    incidents.to_csv(path, date_format=datasets.TIME_FORMAT, encoding='latin-1')
+
+
+def generate_starting_points(num_bases, seed=0):
+    """
+    Generate random drones bases around Paris, spread like the incidents.
+
+    :param num_bases: (int) number of bases.
+    :param seed: (int) seed of the random draws.
+
+    :return: (np.array) drones initial locations (name, latitude, longitude) as strings, like
+        drones.STARTING_POINTS.
+    """
+    random_state = _random_state(seed)
+    return np.column_stack([
+        [f'BASE{index}' for index in range(num_bases)],
+        random_state.normal(_PARIS_LAT, _SPREAD_LAT, num_bases).astype(str),
+        random_state.normal(_PARIS_LON, _SPREAD_LON, num_bases).astype(str),
+    ])
@@ -0,0 +1,290 @@
+"""Behaviour checks of the dispatch of drones, of the random draws and of the caches and jobs
+serving simulations to the web app.
+
+Run them with: python -m pytest -q
+"""
+
+# pylint: disable=no-member
+# The columns of an IncidentTable are set from its __slots__.
+
+import concurrent.futures
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fleet
+import jobs
+import kinematics
+import policies
+import random_streams
+import result_cache
+import simulation
+import spatial
+import synthetic
+
+# Parameters of the flight of drones of the web app, see kinematics.FLIGHT_PARAMS.
+_FLIGHT_PARAMS = {
+    param: getattr(simulation.SimulationParams(), param) for param in kinematics.FLIGHT_PARAMS}
+
+
+def _incidents(num_incidents=3000, seed=0):
+    return simulation.IncidentTable.from_frame(synthetic.generate_incidents(num_incidents, seed))
+
+
+def _hours(*hours):
+    return np.datetime64('2017-01-01T00:00', 'ns') + (np.array(hours) * 3600e9).astype(
+        'timedelta64[ns]')
+
+
+def test_reset_points():
+    # The fourth incident starts before the third one: the drone sent to the third is still busy.
+    times = _hours(0, .5, 3, 2.5, 10)
+    np.testing.assert_array_equal(fleet.reset_points(times, 1), [0, 2, 4])
+    np.testing.assert_array_equal(fleet.reset_points(times, 1, np.array([0, 1, 4])), [0, 2])
+    np.testing.assert_array_equal(fleet.reset_points(times, 8), [0])
+    assert len(fleet.reset_points(times[:0], 1)) == 0
+
+
+def test_dispatch_from_reset_points():
+    incidents = _incidents()
+    avail_ini = synthetic.generate_starting_points(5)
+    locator = simulation.build_locator(incidents, avail_ini)
+    dists, sent = fleet.dispatch(incidents.time_call, locator, 6)
+    resets = fleet.reset_points(incidents.time_call, 6)
+    assert len(resets) > 2
+    # Incidents from a reset point on are dispatched as if they were the first ones.
+    for start, stop in zip(resets, np.append(resets[1:], len(incidents))):
+        shard_dists, shard_sent = fleet.dispatch(
+            incidents.time_call, locator, 6, incidents=np.arange(start, stop))
+        np.testing.assert_array_equal(shard_dists, dists[start:stop])
+        np.testing.assert_array_equal(shard_sent, sent[start:stop])
+
+
+@pytest.mark.parametrize('policy_name', sorted(policies.POLICIES))
+def test_dispatch_sharded_is_dispatch(policy_name):
+    incidents = _incidents()
+    avail_ini = synthetic.generate_starting_points(5)
+    locator = simulation.build_locator(incidents, avail_ini)
+    policy = policies.create(policy_name, incidents, avail_ini, locator, _FLIGHT_PARAMS)
+    expected = fleet.dispatch(incidents.time_call, locator, 6, policy=policy)
+    for max_workers in (1, 2):
+        result = fleet.dispatch_sharded(
+            incidents.time_call, locator, 6, policy=policy, max_workers=max_workers)
+        for values, expected_values in zip(result, expected):
+            np.testing.assert_array_equal(values, expected_values)
+
+
+def test_closest_in_matrix():
+    random_state = np.random.RandomState(0)  # pylint: disable=no-member
+    # Few distinct distances make many ties, NaN where a drone cannot reach an incident.
+    dist_matrix = random_state.randint(0, 5, (200, 30)).astype(float)
+    dist_matrix[random_state.rand(*dist_matrix.shape) < .2] = np.nan
+    locator = fleet.ClosestInMatrix(dist_matrix, num_candidates=4)
+    for available in random_state.rand(20, dist_matrix.shape[1]) < .3:
+        locator.available[:] = available
+        for incident, row in enumerate(dist_matrix):
+            dists = np.where(available, row, np.nan)
+            expected = -1 if np.isnan(dists).all() else np.nanargmin(dists)
+            assert locator.closest(incident) == expected
+
+
+def test_ball_tree_dispatch_is_matrix_dispatch():
+    incidents = _incidents()
+    avail_ini = synthetic.generate_starting_points(40).astype(object)
+    # A starting point without location is never sent.
+    avail_ini[3, 1:] = 'unknown'
+    drone_lats, drone_lons = (
+        pd.to_numeric(avail_ini[:, column], errors='coerce') for column in (1, 2))
+    matrix = simulation.build_locator(incidents, avail_ini)
+    assert isinstance(matrix, fleet.ClosestInMatrix)
+    ball_tree = spatial.ClosestInBallTree(
+        drone_lats, drone_lons, incidents.latitude, incidents.longitude)
+    for unavail_delta in (1, 12):
+        dists, sent = fleet.dispatch(incidents.time_call, ball_tree, unavail_delta)
+        expected_dists, expected_sent = fleet.dispatch(
+            incidents.time_call, matrix, unavail_delta)
+        np.testing.assert_array_equal(sent, expected_sent)
+        # Distances of pairs are computed apart from the matrix, up to rounding errors.
+        np.testing.assert_allclose(dists, expected_dists, rtol=1e-9)
+
+
+def test_only_if_faster_distances():
+    bls_time = np.array([300, 600, 1500, 10, np.nan])
+    # pylint: disable=protected-access
+    max_dists = policies._max_faster_distances(bls_time, _FLIGHT_PARAMS)
+    flight_params = [_FLIGHT_PARAMS[param] for param in kinematics.FLIGHT_PARAMS]
+    known = max_dists[:3]
+    assert (kinematics.flight_time(known, *flight_params) < bls_time[:3]).all()
+    # Just farther, the drone is not faster anymore.
+    assert (kinematics.flight_time(known + 1e-9, *flight_params) >= bls_time[:3]).all()
+    # Never faster within 10 seconds, always sent when the BLS team time is unknown.
+    assert max_dists[3] == -1
+    assert max_dists[4] == np.inf
+
+
+def test_only_if_faster_dispatch():
+    incidents = _incidents()
+    avail_ini = synthetic.generate_starting_points(5)
+    locator = simulation.build_locator(incidents, avail_ini)
+    policy = policies.create('only_if_faster', incidents, avail_ini, locator, _FLIGHT_PARAMS)
+    dists, sent = fleet.dispatch(incidents.time_call, locator, 6, policy=policy)
+    flight_times = kinematics.flight_time(dists, *(
+        _FLIGHT_PARAMS[param] for param in kinematics.FLIGHT_PARAMS))
+    assert (sent == fleet.DECLINED).any()
+    assert (flight_times[sent >= 0] < incidents.bls_time[sent >= 0]).all()
+    assert np.isnan(dists[sent == fleet.DECLINED]).all()
+
+
+def test_closest_policy_is_default_dispatch():
+    incidents = _incidents()
+    avail_ini = synthetic.generate_starting_points(5)
+    locator = simulation.build_locator(incidents, avail_ini)
+    policy = policies.create('closest', incidents, avail_ini, locator)
+    for values, expected_values in zip(
+            fleet.dispatch(incidents.time_call, locator, 6, policy=policy),
+            fleet.dispatch(incidents.time_call, locator, 6)):
+        np.testing.assert_array_equal(values, expected_values)
+    with pytest.raises(ValueError):
+        policies.create('farthest', incidents, avail_ini, locator)
+
+
+def test_counter_streams():
+    incidents = _incidents(500)
+    draws = random_streams.CounterStreams(1).uniform(incidents, 'detection')
+    assert ((draws >= 0) & (draws < 1)).all()
+    assert abs(draws.mean() - .5) < .05
+    # The draw of an incident does not depend on the other incidents.
+    subset = simulation.IncidentTable(*(
+        getattr(incidents, name)[::-3] for name in simulation.IncidentTable.__slots__))
+    np.testing.assert_array_equal(
+        random_streams.CounterStreams(1).uniform(subset, 'detection'), draws[::-3])
+    # Other stages and seeds draw other numbers.
+    assert (random_streams.CounterStreams(1).uniform(incidents, 'witness') != draws).all()
+    assert (random_streams.CounterStreams(2).uniform(incidents, 'detection') != draws).all()
+
+
+def test_sequential_streams():
+    incidents = _incidents(500)
+    streams = random_streams.SequentialStreams(1)
+    first = streams.uniform(incidents, 'detection')
+    np.testing.assert_array_equal(
+        random_streams.SequentialStreams(1).uniform(incidents, 'witness'), first)
+    assert (streams.uniform(incidents, 'detection') != first).any()
+
+
+def test_result_cache_memory():
+    cache = result_cache.ResultCache(max_bytes=1000)
+    calls = []
+    assert cache.get_or_compute('a', lambda: calls.append('a') or [1]) == [1]
+    assert cache.get_or_compute('a', lambda: calls.append('a') or [2]) == [1]
+    assert calls == ['a']
+    # Values larger than the budget are not kept, older ones are evicted.
+    cache.put('large', bytes(2000))
+    assert cache.get('large') is None
+    for index in range(20):
+        cache.put(f'b{index}', bytes(100))
+    assert cache.get('a') is None
+    assert cache.get('b19') == bytes(100)
+
+
+def test_result_cache_disk(tmp_path):
+    cache = result_cache.ResultCache(max_bytes=0, disk_dir=str(tmp_path))
+    assert not cache.is_computing('a')
+    assert cache.get_or_compute('a', lambda: {'value': 1}) == {'value': 1}
+    # Other processes find the value on disk, and no lock file is left behind.
+    other = result_cache.ResultCache(max_bytes=1000, disk_dir=str(tmp_path))
+    assert other.get('a') == {'value': 1}
+    assert not other.is_computing('a')
+    assert os.listdir(str(tmp_path)) == ['a.pickle']
+
+
+def test_result_cache_computes_once(tmp_path):
+    cache = result_cache.ResultCache(max_bytes=1000, disk_dir=str(tmp_path))
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    def get_or_compute():
+        # A cache of its own, as in another process sharing the directory.
+        return result_cache.ResultCache(
+            max_bytes=1000, disk_dir=str(tmp_path)).get_or_compute('a', compute)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(get_or_compute)
+        started.wait(5)
+        assert cache.is_computing('a')
+        others = [executor.submit(get_or_compute) for unused_index in range(3)]
+        release.set()
+        assert [future.result() for future in [first] + others] == [42] * 4
+    assert calls == [1]
+    assert not cache.is_computing('a')
+    assert os.listdir(str(tmp_path)) == ['a.pickle']
+
+
+def test_jobs_are_shared_by_key():
+    manager = jobs.JobManager(max_workers=2)
+    calls = []
+
+    def compute(job):
+        calls.append(job.key)
+        job.report_stage('compute')
+        return job.key
+
+    job = manager.submit('tab1', 'a', compute, stages=('compute',))
+    assert manager.submit('tab2', 'a', compute, stages=('compute',)) is job
+    assert job.future.result(5) == 'a'
+    assert job.progress == 1
+    assert calls == ['a']
+    assert 'a' in manager
+
+
+def test_failed_job_is_started_again():
+    manager = jobs.JobManager(max_workers=1)
+    outcomes = iter([ValueError('failed'), 'done'])
+
+    def compute(unused_job):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    job = manager.submit('tab', 'a', compute)
+    with pytest.raises(ValueError):
+        job.future.result(5)
+    retried = manager.submit('tab', 'a', compute)
+    assert retried is not job
+    assert retried.future.result(5) == 'done'
+
+
+def test_unwatched_job_is_cancelled():
+    manager = jobs.JobManager(max_workers=2)
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute(job):
+        started.set()
+        release.wait(5)
+        job.report_stage('compute')
+        return job.key
+
+    job = manager.submit('tab1', 'a', compute, stages=('compute', 'figures'))
+    started.wait(5)
+    assert job.current_stage == 'compute'
+    # The job is still watched by another tab, then by nobody.
+    manager.submit('tab2', 'a', compute)
+    manager.watch('tab1', 'b')
+    assert 'a' in manager
+    manager.watch('tab2', 'b')
+    assert 'a' not in manager
+    release.set()
+    with pytest.raises(jobs.Cancelled):
+        job.future.result(5)